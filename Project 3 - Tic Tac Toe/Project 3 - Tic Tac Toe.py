@@ -2,7 +2,7 @@
 Tic-Tac-Toe Game using Python
 
 This project implements a simple console-based Tic-Tac-Toe game using Python. 
-The game allows two players to take turns marking spaces on a 3x3 grid as either 'X' or 'O'. 
+The game allows two players (or a player and the computer, or the computer against itself) to take turns marking spaces on a 3x3 grid as either 'X' or 'O'. 
 The game ends when one player successfully marks three consecutive spaces in a row, column, or diagonal, or when the grid is completely filled without a winner (resulting in a tie).
 
 The project demonstrates:
@@ -10,7 +10,11 @@ The project demonstrates:
 - Using dictionaries to represent the game board.
 - Organizing code into functions for improved readability and maintainability.
 - Handling user input and controlling game flow in a loop until the game is over.
-- Simple win detection logic based on preset win conditions.
+- Simple win detection logic based on preset win conditions, stored as bitmasks.
+- A computer opponent using alpha-beta search with a transposition table shared across games and symmetric positions.
+- Bigger m x n boards with k in a row to win (such as 15x15 gomoku), searched by iterative deepening within a time budget.
+- An asyncio server (--serve) running many matches at once over a simple line protocol.
+- Redrawing only the changed cell and status line in place with ANSI escape sequences, falling back to plain printing when not on a terminal.
 
 To run this project, ensure you have Python installed. The game runs entirely in the console and does not require any additional libraries. 
 When executed, the game prompts players to take turns entering their moves, and the result is displayed after every turn.
@@ -22,77 +26,831 @@ Author: Sun Yufei
 Date: 2024-08-17
 """
 
+import argparse
+import asyncio
+import ctypes
+import mmap
 import os
+import random
+import shutil
+import sys
+import time
+
+# Board positions in order; position i is bit i of a player's 9-bit mask
+POSITIONS = ['TL', 'TM', 'TR', 'ML', 'MM', 'MR', 'BL', 'BM', 'BR']
+FULL_BOARD = (1 << 9) - 1
+
+# Masks of the eight winning lines
+WIN_MASKS = [
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100  # diagonals
+]
+
+# The eight symmetries of the grid (rotations and reflections), each mapping
+# position i to SYMMETRIES[s][i]
+SYMMETRIES = [
+    [r * 3 + c for r in range(3) for c in range(3)],  # identity
+    [c * 3 + 2 - r for r in range(3) for c in range(3)],  # quarter turn
+    [(2 - r) * 3 + 2 - c for r in range(3) for c in range(3)],  # half turn
+    [(2 - c) * 3 + r for r in range(3) for c in range(3)],  # three-quarter turn
+    [r * 3 + 2 - c for r in range(3) for c in range(3)],  # mirror left-right
+    [(2 - r) * 3 + c for r in range(3) for c in range(3)],  # mirror top-bottom
+    [c * 3 + r for r in range(3) for c in range(3)],  # main diagonal
+    [(2 - c) * 3 + 2 - r for r in range(3) for c in range(3)]  # anti-diagonal
+]
+
+# SYMMETRY_TABLES[s][mask] is mask with every position moved by symmetry s
+SYMMETRY_TABLES = [
+    [sum(1 << perm[i] for i in range(9) if mask >> i & 1) for mask in range(1 << 9)]
+    for perm in SYMMETRIES
+]
+
+# Scores are from the point of view of the player to move: a win scores one
+# more than the number of empty squares left, so quicker wins score higher
+EXACT, LOWER, UPPER = 0, 1, 2
+TRANSPOSITION_TABLE = {}  # Canonical position -> (score, EXACT/LOWER/UPPER), shared by all games
+BEST_MOVES = {}  # Canonical position -> best position index in the canonical orientation
+
+# The opening book: every 3x3 position solved ahead of time, one byte each,
+# at the position's base-3 number (digit i is 0, 1 or 2 for an empty, x or o
+# position i) after BOOK_MAGIC. The low four bits hold the best move
+# (BOOK_NO_MOVE once the game is over), the next two the outcome for the
+# player to move
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tictactoe.book')
+BOOK_MAGIC = b'TTTB\x01'
+BOOK_NO_MOVE = 15
+WIN, DRAW, LOSS = 1, 2, 3
+OUTCOMES = {WIN: 'win', DRAW: 'draw', LOSS: 'loss'}
+BASE3 = [sum(3 ** i for i in range(9) if mask >> i & 1) for mask in range(1 << 9)]
+BOOK = None  # The memory-mapped book, once load_book() has found it
+
+# Seconds between the computer's moves when it plays itself
+AI_DELAY = 0.5
+
+# Seconds the computer may think about a move on boards other than 3x3
+AI_TIME_BUDGET = 1.0
+
+# Score of a win in the search on bigger boards (plus the depth left, so quicker wins score higher)
+WIN_SCORE = 10 ** 30
+
+# Column letters of the positions on boards other than 3x3
+COLUMN_NAMES = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Game server settings: the biggest board it plays, the connections that may
+# wait to be accepted, the bytes queued to a client before it counts as not
+# reading and is dropped, and the seconds between reports of its load
+SERVER_MAX_SIZE = 19
+SERVER_BACKLOG = 1024
+SERVER_MAX_BUFFER = 1 << 16
+SERVER_REPORT_EVERY = 10
+RULES_CACHE = {}  # (rows, cols, k) -> Rules shared by every match on the server
+
+class Rules:
+    """An m x n board with k in a row to win (m rows, n columns).
+
+    Positions are numbered row by row, and each player's marks are kept as a
+    bitmask with bit i set for position i. The 3x3 board keeps its 'TL'..'BR'
+    position names; other boards name positions by column letter and row
+    number, like 'H8'."""
+
+    def __init__(self, rows=3, cols=3, k=3):
+        if not (1 <= cols <= len(COLUMN_NAMES) and rows >= 1 and 1 <= k <= max(rows, cols)):
+            raise ValueError(f"Can't play {k} in a row on {rows}x{cols}")
+        self.rows, self.cols, self.k = rows, cols, k
+        self.size = rows * cols
+        self.full = (1 << self.size) - 1
+        if (rows, cols) == (3, 3):
+            self.names = list(POSITIONS)
+        else:
+            self.names = [f'{COLUMN_NAMES[c]}{r + 1}' for r in range(rows) for c in range(cols)]
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        # Every line of k positions, and the lines through each position
+        self.lines = []
+        self.lines_through = [[] for _ in range(self.size)]
+        for r in range(rows):
+            for c in range(cols):
+                for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    if 0 <= r + (k - 1) * dr < rows and 0 <= c + (k - 1) * dc < cols:
+                        cells = [(r + i * dr) * cols + c + i * dc for i in range(k)]
+                        line = sum(1 << cell for cell in cells)
+                        self.lines.append(line)
+                        for cell in cells:
+                            self.lines_through[cell].append(line)
+
+        # Worth of a line holding 0..k marks of one player only, for the search
+        self.line_scores = [0] + [10 ** i for i in range(k)]
+
+        # Masks of the positions not in the first or last column, to shift marks sideways
+        left_edge = sum(1 << (r * cols) for r in range(rows))
+        self.not_left = self.full & ~left_edge
+        self.not_right = self.full & ~(left_edge << (cols - 1))
+
+    def is_classic(self):
+        """Checks if this is the 3x3 game the perfect engine plays."""
+        return (self.rows, self.cols, self.k) == (3, 3, 3)
+
+    def new_board(self):
+        """Returns an empty board, as a dict from position names to marks."""
+        return {name: ' ' for name in self.names}
+
+    def wins_at(self, mask, cell):
+        """Checks if a player's mask has k in a row through cell, scanning only
+        the four lines through it (enough when cell was the last move)."""
+        r, c = divmod(cell, self.cols)
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            count = 1
+            for sign in (1, -1):
+                rr, cc = r + sign * dr, c + sign * dc
+                while 0 <= rr < self.rows and 0 <= cc < self.cols and mask >> (rr * self.cols + cc) & 1:
+                    count += 1
+                    rr, cc = rr + sign * dr, cc + sign * dc
+            if count >= self.k:
+                return True
+        return False
+
+    def neighbours(self, mask):
+        """Returns the mask of the positions next to (or on) the marked ones."""
+        sideways = mask | (mask & self.not_right) << 1 | (mask & self.not_left) >> 1
+        return (sideways | sideways << self.cols | sideways >> self.cols) & self.full
+
+# The 3x3 game
+CLASSIC = Rules()
+
+def ansi_terminal():
+    """Checks if the output is a terminal that understands ANSI escape sequences.
+
+    The Windows console only does after virtual terminal processing is switched
+    on, which older versions of Windows refuse; those get plain printing."""
+    if not sys.stdout.isatty():
+        return False
+    if os.name != 'nt':
+        return True
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.GetStdHandle(-11)  # Standard output
+    mode = ctypes.c_ulong()
+    if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+        return False
+    return bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))  # ENABLE_VIRTUAL_TERMINAL_PROCESSING
 
 def clear_screen():
-    """Clears the console screen for both Windows and Unix-based systems."""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    """Clears the console screen with ANSI escape sequences, without starting a shell."""
+    sys.stdout.write('\x1b[2J\x1b[H')
+    sys.stdout.flush()
 
-def print_board(board):
+def print_board(board, rules=CLASSIC):
     """Prints the current state of the Tic-Tac-Toe board."""
-    print(board['TL'] + '|' + board['TM'] + '|' + board['TR'])
-    print('-+-+-')
-    print(board['ML'] + '|' + board['MM'] + '|' + board['MR'])
-    print('-+-+-')
-    print(board['BL'] + '|' + board['BM'] + '|' + board['BR'])
-
-def check_winner(board, turn):
-    """Checks if the current player has won the game."""
-    win_conditions = [
-        ['TL', 'TM', 'TR'], ['ML', 'MM', 'MR'], ['BL', 'BM', 'BR'],  # rows
-        ['TL', 'ML', 'BL'], ['TM', 'MM', 'BM'], ['TR', 'MR', 'BR'],  # columns
-        ['TL', 'MM', 'BR'], ['TR', 'MM', 'BL']  # diagonals
-    ]
-    
-    for condition in win_conditions:
-        if board[condition[0]] == board[condition[1]] == board[condition[2]] == turn:
+    marks = list(board.values())
+    labels = (rules.rows, rules.cols) != (3, 3)  # Name the rows and columns of other boards
+    if labels:
+        print('   ' + ' '.join(COLUMN_NAMES[:rules.cols]))
+    for r in range(rules.rows):
+        if r:
+            print(('   ' if labels else '') + '-+' * (rules.cols - 1) + '-')
+        row = '|'.join(marks[r * rules.cols:(r + 1) * rules.cols])
+        print(f'{r + 1:2} {row}' if labels else row)
+
+class ConsoleRenderer:
+    """Shows a game on the console.
+
+    On a terminal the board is drawn once per game, then only the changed
+    cell and the status line below the board are rewritten in place with
+    cursor-positioning escape sequences. When the output is not a terminal
+    (piped to a file or another program) or a Windows console without
+    escape sequence support, everything is printed one after the other
+    instead, with no escape sequences. So is a board too big for the
+    terminal, which would scroll and throw the cursor positions off."""
+
+    def __init__(self):
+        self.terminal = ansi_terminal()
+        self.ansi = self.terminal  # Whether the current game is redrawn in place
+        self.rules = CLASSIC
+        self.status_line = 1  # Screen line of the status, below the board
+
+    def new_game(self, board, rules):
+        """Draws the empty board of a new game."""
+        self.rules = rules
+        labels = (rules.rows, rules.cols) != (3, 3)
+        self.status_line = 2 * rules.rows + labels + 1
+        size = shutil.get_terminal_size()
+        self.ansi = self.terminal and size.lines > self.status_line and size.columns >= 2 * rules.cols + 3 * labels
+        if self.ansi:
+            clear_screen()
+        print_board(board, rules)
+
+    def cell_position(self, cell):
+        """Returns the screen line and column (counting from 1) of a cell as print_board draws it."""
+        r, c = divmod(cell, self.rules.cols)
+        if (self.rules.rows, self.rules.cols) != (3, 3):  # Under the column letters, after the row numbers
+            return 2 * r + 2, 2 * c + 4
+        return 2 * r + 1, 2 * c + 1
+
+    def move(self, board, cell):
+        """Shows a new mark on the board."""
+        if not self.ansi:
+            print_board(board, self.rules)
+            return
+        line, column = self.cell_position(cell)
+        sys.stdout.write(f'\x1b[{line};{column}H{board[self.rules.names[cell]]}')
+        self.status('')
+
+    def status(self, text):
+        """Shows a message under the board, replacing the previous one."""
+        if self.ansi:
+            sys.stdout.write(f'\x1b[{self.status_line};1H\x1b[K{text}\x1b[{self.status_line + 1};1H\x1b[J')
+            sys.stdout.flush()
+        elif text:
+            print(text)
+
+    def ask(self, prompt):
+        """Asks the player for a line of input under the status line."""
+        if self.ansi:
+            sys.stdout.write(f'\x1b[{self.status_line + 1};1H\x1b[J')
+        return input(prompt)
+
+def player_mask(board, turn):
+    """Returns the mask of the positions the player has marked."""
+    return sum(1 << i for i, mark in enumerate(board.values()) if mark == turn)
+
+def has_won(mask):
+    """Checks if a player's mask covers one of the winning lines."""
+    for win in WIN_MASKS:
+        if mask & win == win:
             return True
     return False
 
+def canonical(me, opp):
+    """Returns the key of a position (player to move's mask, opponent's mask)
+    that is the same for all its symmetric copies, and the symmetry leading to it."""
+    best_key, best_symmetry = None, 0
+    for symmetry, table in enumerate(SYMMETRY_TABLES):
+        key = table[me] | table[opp] << 9
+        if best_key is None or key < best_key:
+            best_key, best_symmetry = key, symmetry
+    return best_key, best_symmetry
+
+def negamax(me, opp, alpha, beta):
+    """Scores a position for the player to move with alpha-beta search.
+
+    Results are kept in TRANSPOSITION_TABLE under the canonical key, as exact
+    scores or as bounds when the search was cut off, so symmetric positions
+    and later games reuse them."""
+    if has_won(opp):
+        return -(1 + 9 - bin(me | opp).count('1'))
+    if me | opp == FULL_BOARD:
+        return 0
+
+    key, _ = canonical(me, opp)
+    entry = TRANSPOSITION_TABLE.get(key)
+    if entry is not None:
+        score, flag = entry
+        if flag == EXACT:
+            return score
+        if flag == LOWER:
+            alpha = max(alpha, score)
+        else:
+            beta = min(beta, score)
+        if alpha >= beta:
+            return score
+
+    original_alpha = alpha
+    best = -10
+    free = FULL_BOARD & ~(me | opp)
+    while free:
+        move = free & -free
+        free ^= move
+        best = max(best, -negamax(opp, me | move, -beta, -alpha))
+        alpha = max(alpha, best)
+        if alpha >= beta:
+            break
+
+    if best <= original_alpha:
+        TRANSPOSITION_TABLE[key] = (best, UPPER)
+    elif best >= beta:
+        TRANSPOSITION_TABLE[key] = (best, LOWER)
+    else:
+        TRANSPOSITION_TABLE[key] = (best, EXACT)
+    return best
+
+def best_move(me, opp):
+    """Returns the index of the best position for the player to move.
+
+    The answer is stored in BEST_MOVES for the canonical position, so after a
+    position (or a symmetric copy) has been seen once, this is a table lookup."""
+    key, symmetry = canonical(me, opp)
+    move = BEST_MOVES.get(key)
+    if move is None:
+        best_score = None
+        free = FULL_BOARD & ~(me | opp)
+        for i in range(9):
+            if free >> i & 1:
+                score = -negamax(opp, me | 1 << i, -10, 10)
+                if best_score is None or score > best_score:
+                    best_score, move = score, SYMMETRIES[symmetry][i]
+        BEST_MOVES[key] = move
+    return SYMMETRIES[symmetry].index(move)  # Back from the canonical orientation
+
+def warm_up(me=0, opp=0):
+    """Fills BEST_MOVES for every position reachable from the given one, so
+    that every later move of the computer is a lookup."""
+    if has_won(opp) or me | opp == FULL_BOARD:
+        return
+    key, _ = canonical(me, opp)
+    if key in BEST_MOVES:
+        return
+    best_move(me, opp)
+    free = FULL_BOARD & ~(me | opp)
+    for i in range(9):
+        if free >> i & 1:
+            warm_up(opp, me | 1 << i)
+
+def reachable_positions():
+    """Returns every position (x's mask, o's mask) that can come up in a game: 5,478 in all."""
+    seen = set()
+    stack = [(0, 0)]
+    while stack:
+        x, o = stack.pop()
+        if (x, o) in seen:
+            continue
+        seen.add((x, o))
+        if has_won(x) or has_won(o) or x | o == FULL_BOARD:
+            continue
+        x_to_move = bin(x).count('1') == bin(o).count('1')
+        free = FULL_BOARD & ~(x | o)
+        for i in range(9):
+            if free >> i & 1:
+                stack.append((x | 1 << i, o) if x_to_move else (x, o | 1 << i))
+    return seen
+
+def build_book(path=BOOK_PATH):
+    """Solves every reachable position and writes the opening book. Returns the number of positions."""
+    table = bytearray(3 ** 9)
+    positions = reachable_positions()
+    for x, o in positions:
+        me, opp = (x, o) if bin(x).count('1') == bin(o).count('1') else (o, x)
+        if has_won(opp):
+            entry = BOOK_NO_MOVE | LOSS << 4
+        elif me | opp == FULL_BOARD:
+            entry = BOOK_NO_MOVE | DRAW << 4
+        else:
+            score = negamax(me, opp, -10, 10)
+            outcome = WIN if score > 0 else LOSS if score < 0 else DRAW
+            entry = best_move(me, opp) | outcome << 4
+        table[BASE3[x] + 2 * BASE3[o]] = entry
+    with open(path, 'wb') as book:
+        book.write(BOOK_MAGIC + table)
+    return len(positions)
+
+def load_book(path=BOOK_PATH):
+    """Memory-maps the opening book if it exists and looks right. Returns whether it did."""
+    global BOOK
+    try:
+        with open(path, 'rb') as book:
+            table = mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # Missing or empty
+        return False
+    if len(table) != len(BOOK_MAGIC) + 3 ** 9 or table[:len(BOOK_MAGIC)] != BOOK_MAGIC:
+        table.close()
+        return False
+    BOOK = table
+    return True
+
+def book_entry(x, o):
+    """Returns the opening book's (best move or None, outcome) for a position given by x's and o's masks."""
+    entry = BOOK[len(BOOK_MAGIC) + BASE3[x] + 2 * BASE3[o]]
+    move = entry & 0xf
+    return (None if move == BOOK_NO_MOVE else move), entry >> 4
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+def evaluate(me, opp, rules):
+    """Scores a position for the player to move by the lines only one player has marks in."""
+    score = 0
+    for line in rules.lines:
+        mine, theirs = me & line, opp & line
+        if mine and not theirs:
+            score += rules.line_scores[bin(mine).count('1')]
+        elif theirs and not mine:
+            score -= rules.line_scores[bin(theirs).count('1')]
+    return score
+
+def ordered_moves(me, opp, rules, first=None):
+    """Returns the empty positions worth trying, best guesses first.
+
+    Only positions next to a mark are considered (the centre on an empty
+    board, every empty position if none is next to a mark). They are ordered by how much they add to the lines of both
+    players, with the best move of the previous, shallower search first."""
+    occupied = me | opp
+    if not occupied:
+        return [(rules.rows // 2) * rules.cols + rules.cols // 2]
+    free = rules.neighbours(occupied) & ~occupied or rules.full & ~occupied
+    moves = []
+    while free:
+        bit = free & -free
+        free ^= bit
+        cell = bit.bit_length() - 1
+        worth = 0
+        for line in rules.lines_through[cell]:
+            mine, theirs = me & line, opp & line
+            if not theirs:
+                worth += rules.line_scores[bin(mine).count('1') + 1]  # Attack
+            if not mine:
+                worth += rules.line_scores[bin(theirs).count('1') + 1]  # Defence
+        moves.append((worth, cell))
+    moves.sort(reverse=True)
+    ordered = [cell for _, cell in moves]
+    if first in ordered:
+        ordered.remove(first)
+        ordered.insert(0, first)
+    return ordered
+
+def search(me, opp, depth, alpha, beta, rules, deadline, best_moves):
+    """Scores a position for the player to move with depth-limited alpha-beta
+    search, remembering each position's best move in best_moves for ordering."""
+    if time.perf_counter() > deadline:
+        raise SearchTimeout()
+    if me | opp == rules.full:
+        return 0
+    if depth == 0:
+        return evaluate(me, opp, rules)
+
+    best, best_cell = -WIN_SCORE * 2, None
+    for cell in ordered_moves(me, opp, rules, best_moves.get((me, opp))):
+        if rules.wins_at(me | 1 << cell, cell):
+            best, best_cell = WIN_SCORE + depth, cell
+            break
+        score = -search(opp, me | 1 << cell, depth - 1, -beta, -alpha, rules, deadline, best_moves)
+        if score > best:
+            best, best_cell = score, cell
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    best_moves[me, opp] = best_cell
+    return best
+
+def plan_move(me, opp, rules, budget=AI_TIME_BUDGET):
+    """Returns the position to play on any m,n,k board by iterative deepening:
+    searching one move deeper each time until the time budget runs out, and
+    keeping the move of the deepest search that finished."""
+    deadline = time.perf_counter() + budget
+    best_moves = {}
+    move = ordered_moves(me, opp, rules)[0]
+    empty = rules.size - bin(me | opp).count('1')
+    for depth in range(1, empty + 1):
+        try:
+            score = search(me, opp, depth, -WIN_SCORE * 2, WIN_SCORE * 2, rules, deadline, best_moves)
+        except SearchTimeout:
+            break
+        move = best_moves[me, opp]
+        if abs(score) > WIN_SCORE:
+            break  # The game is decided, looking deeper won't change the move
+    return move
+
+def ai_move(board, turn, rules=CLASSIC):
+    """Returns the position the computer plays for the current player."""
+    other = 'o' if turn == 'x' else 'x'
+    me, opp = player_mask(board, turn), player_mask(board, other)
+    if rules.is_classic():
+        if BOOK is not None:
+            x, o = (me, opp) if turn == 'x' else (opp, me)
+            return rules.names[book_entry(x, o)[0]]
+        return rules.names[best_move(me, opp)]
+    return rules.names[plan_move(me, opp, rules)]
+
+def hint(board, turn, rules=CLASSIC):
+    """Returns a suggested move for the current player, with the outcome of
+    perfect play from here ('win', 'draw' or 'loss') when the book knows it."""
+    if rules.is_classic() and BOOK is not None:
+        move, outcome = book_entry(player_mask(board, 'x'), player_mask(board, 'o'))
+        return rules.names[move], OUTCOMES[outcome]
+    return ai_move(board, turn, rules), None
+
+def choose_rules():
+    """Asks for the board size and the number in a row to win."""
+    while True:
+        answer = input('Rows, columns and marks in a row to win (Enter for 3 3 3, 15 15 5 for gomoku): ').split()
+        if not answer:
+            return CLASSIC
+        try:
+            rows, cols, k = (int(number) for number in answer)
+            return Rules(rows, cols, k)
+        except ValueError:
+            print("Invalid board, try again.")
+
+def choose_players():
+    """Asks for the game mode and returns the set of players the computer plays."""
+    while True:
+        mode = input('Choose a mode: 1) two players, 2) against the computer, 3) computer vs computer: ').strip()
+        if mode == '1':
+            return set()
+        if mode == '2':
+            first = input('Do you want to go first? (yes|no): ').lower() == 'yes'
+            return {'o'} if first else {'x'}
+        if mode == '3':
+            return {'x', 'o'}
+        print("Invalid mode, try again.")
+
+def parse_address(address):
+    """Splits a server address into ('unix', path) for unix:PATH, or (host, port) for HOST:PORT."""
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+def get_rules(rows, cols, k):
+    """Returns the shared Rules for an m,n,k game, building them the first time."""
+    key = (rows, cols, k)
+    rules = RULES_CACHE.get(key)
+    if rules is None:
+        if rows > SERVER_MAX_SIZE or cols > SERVER_MAX_SIZE:
+            raise ValueError(f"Boards are at most {SERVER_MAX_SIZE}x{SERVER_MAX_SIZE}")
+        rules = RULES_CACHE[key] = Rules(rows, cols, k)
+    return rules
+
+class Player:
+    """A connection to the game server and the match it plays in, if any."""
+    __slots__ = ('writer', 'match', 'mark', 'waiting_for')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.match = None
+        self.mark = None  # 'x' or 'o' during a match
+        self.waiting_for = None  # Rules the player waits for an opponent with
+
+    def send(self, line):
+        """Queues a line to the player without waiting for it to be sent.
+        A player with more than SERVER_MAX_BUFFER bytes unread is disconnected."""
+        transport = self.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > SERVER_MAX_BUFFER:
+            transport.abort()  # Its handler sees the connection end and cleans up
+            return
+        self.writer.write((line + '\n').encode())
+
+class Match:
+    """One game between two players on the server: the rules, both players'
+    marks as bitmasks, whose turn it is and how many moves were made."""
+    __slots__ = ('rules', 'players', 'masks', 'turn', 'moves')
+
+    def __init__(self, rules, x, o):
+        self.rules = rules
+        self.players = (x, o)
+        self.masks = [0, 0]
+        self.turn = 0  # Index of the player to move, x starts
+        self.moves = 0
+
+class GameServer:
+    """Runs matches for clients speaking a line protocol over asyncio streams.
+
+    Clients send:
+        PLAY [ROWS COLS K]  find an opponent for a game (3 3 3 by default)
+        MOVE POSITION       mark a position, named as on the console board
+        QUIT                leave the current match
+    and the server answers with:
+        WAITING                     no opponent yet
+        START MARK ROWS COLS K      a match started, playing as MARK (x or o)
+        TURN                        it's this player's move
+        MOVED MARK POSITION         a move was made (sent to both players)
+        END WIN|LOSS|DRAW|ABANDONED the match is over
+        ERROR MESSAGE               the last line was refused
+    Nothing in the server blocks: each client has one task reading its lines,
+    and replies to the opponent are queued without waiting on their socket."""
+
+    def __init__(self):
+        self.waiting = {}  # Rules -> the player waiting for an opponent with them
+        self.connections = 0
+        self.active = 0  # Matches being played
+        self.finished = 0
+
+    async def handle_client(self, reader, writer):
+        """Serves one client until it disconnects."""
+        player = Player(writer)
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.handle_line(player, line.decode(errors='replace').split())
+                await writer.drain()
+        except (OSError, ValueError):  # ValueError: a line longer than the stream's limit
+            pass
+        finally:
+            self.leave(player)
+            self.connections -= 1
+            writer.close()
+
+    def handle_line(self, player, words):
+        """Carries out one line sent by a player."""
+        command = words[0].upper() if words else ''
+        if command == 'PLAY':
+            self.play(player, words[1:])
+        elif command == 'MOVE' and len(words) == 2:
+            self.move(player, words[1].upper())
+        elif command == 'QUIT':
+            self.leave(player)
+        else:
+            player.send('ERROR unknown command')
+
+    def play(self, player, sizes):
+        """Pairs the player with one waiting for the same rules, or makes them wait."""
+        if player.match is not None or player.waiting_for is not None:
+            player.send('ERROR already playing')
+            return
+        if len(sizes) not in (0, 3):
+            player.send('ERROR expected PLAY [ROWS COLS K]')
+            return
+        try:
+            rows, cols, k = (int(size) for size in sizes) if sizes else (3, 3, 3)
+            rules = get_rules(rows, cols, k)
+        except ValueError as error:
+            player.send(f'ERROR {error}')
+            return
+
+        opponent = self.waiting.pop(rules, None)
+        if opponent is None:
+            self.waiting[rules] = player
+            player.waiting_for = rules
+            player.send('WAITING')
+            return
+        opponent.waiting_for = None
+        match = Match(rules, opponent, player)
+        for mark, someone in zip('xo', match.players):
+            someone.match, someone.mark = match, mark
+            someone.send(f'START {mark} {rows} {cols} {k}')
+        opponent.send('TURN')
+        self.active += 1
+
+    def move(self, player, position):
+        """Plays a player's move in their match if it is legal."""
+        match = player.match
+        if match is None:
+            player.send('ERROR not in a match')
+            return
+        if match.players[match.turn] is not player:
+            player.send('ERROR not your turn')
+            return
+        cell = match.rules.index.get(position)
+        if cell is None or (match.masks[0] | match.masks[1]) >> cell & 1:
+            player.send('ERROR invalid move')
+            return
+
+        match.masks[match.turn] |= 1 << cell
+        match.moves += 1
+        for someone in match.players:
+            someone.send(f'MOVED {player.mark} {position}')
+        if match.rules.wins_at(match.masks[match.turn], cell):
+            self.end(match, {player: 'WIN'})
+        elif match.moves == match.rules.size:
+            self.end(match, {})
+        else:
+            match.turn ^= 1
+            match.players[match.turn].send('TURN')
+
+    def end(self, match, results):
+        """Tells both players how a match ended (DRAW unless results says otherwise)."""
+        for someone in match.players:
+            someone.send('END ' + results.get(someone, 'DRAW' if not results else 'LOSS'))
+            someone.match = someone.mark = None
+        self.active -= 1
+        self.finished += 1
+
+    def leave(self, player):
+        """Takes a player out of the queue or their match; the opponent wins by default."""
+        if player.waiting_for is not None:
+            del self.waiting[player.waiting_for]
+            player.waiting_for = None
+        match = player.match
+        if match is not None:
+            opponent = match.players[0] if match.players[1] is player else match.players[1]
+            player.match = player.mark = None
+            opponent.match = opponent.mark = None
+            opponent.send('END ABANDONED')
+            self.active -= 1
+            self.finished += 1
+
+    async def run(self, address):
+        """Serves clients on address forever, printing the load every few seconds."""
+        kind, where = parse_address(address)
+        if kind == 'unix':
+            server = await asyncio.start_unix_server(self.handle_client, where, backlog=SERVER_BACKLOG)
+        else:
+            server = await asyncio.start_server(self.handle_client, kind, where, backlog=SERVER_BACKLOG)
+        print(f"Serving Tic-Tac-Toe on {address}")
+        async with server:
+            while True:
+                await asyncio.sleep(SERVER_REPORT_EVERY)
+                print(f"{self.connections} connections, {self.active} matches playing, "
+                      f"{len(self.waiting)} waiting, {self.finished} finished")
+
+async def bot(address, games, rng):
+    """A client for load tests: plays games of 3x3 with random legal moves."""
+    kind, where = parse_address(address)
+    if kind == 'unix':
+        reader, writer = await asyncio.open_unix_connection(where)
+    else:
+        reader, writer = await asyncio.open_connection(kind, where)
+    free = []
+    writer.write(b'PLAY\n')
+    while games:
+        line = await reader.readline()
+        if not line:
+            break
+        words = line.decode().split()
+        if words[0] == 'START':
+            free = list(get_rules(*(int(size) for size in words[2:])).names)
+        elif words[0] == 'MOVED':
+            free.remove(words[2])
+        elif words[0] == 'TURN':
+            writer.write(f'MOVE {rng.choice(free)}\n'.encode())
+        elif words[0] == 'END':
+            games -= 1
+            if games:
+                writer.write(b'PLAY\n')
+    writer.close()
+
+async def run_bots(address, count, games):
+    """Connects count bots to the server, each playing the given number of games."""
+    rng = random.Random()
+    await asyncio.gather(*(bot(address, games, random.Random(rng.random())) for _ in range(count)))
+
 def main():
     """Main function to handle the game logic."""
+    renderer = ConsoleRenderer()
     play_again = True
     while play_again:
+        rules = choose_rules()
+        computer = choose_players()
+
         # Initialize the board with empty spaces
-        board = {
-            'TL': ' ', 'TM': ' ', 'TR': ' ',
-            'ML': ' ', 'MM': ' ', 'MR': ' ',
-            'BL': ' ', 'BM': ' ', 'BR': ' '
-        }
+        board = rules.new_board()
+        masks = {'x': 0, 'o': 0}  # Each player's marks as a bitmask
         turn = 'x'  # 'x' always starts the game
         move_count = 0  # Keep track of the number of moves made
         game_over = False
         
-        clear_screen()
-        print_board(board)
+        renderer.new_game(board, rules)
         
-        while move_count < 9 and not game_over:
-            # Prompt the current player for their move
-            move = input(f"Player {turn}'s turn. Enter position: ").upper()
+        while move_count < rules.size and not game_over:
+            # Prompt the current player for their move, or let the computer pick it
+            if turn in computer:
+                if computer == {'x', 'o'}:
+                    time.sleep(AI_DELAY)
+                move = ai_move(board, turn, rules)
+            else:
+                move = renderer.ask(f"Player {turn}'s turn. Enter position (? for a hint): ").upper()
+                if move == '?':
+                    suggestion, outcome = hint(board, turn, rules)
+                    renderer.status(f"Try {suggestion}" + (f", perfect play leads to a {outcome}." if outcome else "."))
+                    continue
 
             # Ensure the selected position is valid and not already occupied
             if move in board and board[move] == ' ':
                 board[move] = turn
+                cell = rules.index[move]
+                masks[turn] |= 1 << cell
                 move_count += 1
 
-                clear_screen()
-                print_board(board)
+                renderer.move(board, cell)
 
-                # Check if the current player has won the game
-                if check_winner(board, turn):
-                    print(f"Player {turn} wins!")
+                # Check if the current player has won the game, only the lines through the move can
+                if rules.wins_at(masks[turn], cell):
+                    renderer.status(f"Player {turn} wins!")
                     game_over = True
                 else:
                     # Switch turns between 'x' and 'o'
                     turn = 'o' if turn == 'x' else 'x'
             else:
-                print("Invalid move, try again.")
+                renderer.status("Invalid move, try again.")
         
         if not game_over:
-            print("It's a tie!")
+            renderer.status("It's a tie!")
         
         # Ask if the players want to play again
-        play_again = input('Do you want to play again? (yes|no): ').lower() == 'yes'
+        play_again = renderer.ask('Do you want to play again? (yes|no): ').lower() == 'yes'
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Tic-Tac-Toe')
+    parser.add_argument('--build-book', action='store_true', help='solve every 3x3 position and write the opening book')
+    parser.add_argument('--serve', metavar='ADDRESS', help='run the game server on HOST:PORT or unix:PATH')
+    parser.add_argument('--bots', type=int, metavar='N', help='connect N bots to the server at --serve instead')
+    parser.add_argument('--games', type=int, default=10, help='games each bot plays')
+    args = parser.parse_args()
+
+    if args.build_book:
+        count = build_book()
+        print(f"Solved {count} positions into {BOOK_PATH}")
+    elif args.serve and args.bots:
+        asyncio.run(run_bots(args.serve, args.bots, args.games))
+    elif args.serve:
+        try:
+            asyncio.run(GameServer().run(args.serve))
+        except KeyboardInterrupt:
+            pass
+    else:
+        if not load_book():
+            warm_up()  # Without the book, solve every position up front so each computer move is a lookup
+        main()
@@ -25,9 +25,22 @@ Date: 2024-08-19
 """
 
 from tkinter import *
+from tkinter.messagebox import showinfo
+import argparse
+import collections
+import functools
+import json
+import multiprocessing
+import os
 import random
+import sqlite3
+import sys
 import time
-import tkinter.messagebox
+
+try:
+    import numpy as np  # Optional, lets the bot score its candidate boards in one batch
+except ImportError:
+    np = None
  
 # The height of the Tetris game grid
 HEIGHT = 34
@@ -35,12 +48,40 @@ HEIGHT = 34
 # The width of the Tetris game grid
 WIDTH = 20
  
+# The size of one grid cell on the canvas, in pixels
+CELL = 24
+
 # Constants representing the state of the blocks
 ACTIVE = 1
 PASSIVE = 0
 TRUE = 1
 FALSE = 0
 
+# Points for clearing 1, 2, 3 or 4 lines at once, in units of WIDTH
+LINE_SCORES = [0, 1, 3, 6, 10]
+
+# Gravity levels as (minimum score, milliseconds per row), from the slowest to the fastest
+GRAVITY = [(0, 1000), (1000, 900), (2000, 750), (3000, 600), (4000, 400), (5000, 300),
+           (6000, 200), (7000, 120), (8000, 80), (10000, 50), (12000, 33)]
+
+# Longest wait of the game loop between two ticks, so the clock display stays smooth
+MAX_TICK = 100
+
+# Most gravity steps one tick may catch up on after the loop has stalled
+MAX_CATCHUP = 5
+
+# Leaderboard database, and the old text file it imports once
+SCORE_DB = 'scores.db'
+SCORE_TEXT = 'text.txt'
+SCORE_HEAD = 'score    line    time    scorePtime    linePtime    scorePline    date'
+
+# Number of samples the profiler keeps for each measurement, and its export file
+PROFILE_SAMPLES = 1000
+PROFILE_JSON = 'profile.json'
+
+# Bot heuristic weights for aggregate height, lines cleared, holes and bumpiness
+BOT_WEIGHTS = (-0.510066, 0.760666, -0.35663, -0.184483)
+
 # Block shapes and their rotations (defined as coordinates)
 style = [
     [[(0, 0), (0, 1), (1, 1), (2, 1)], [(1, 0), (1, 1), (1, 2), (0, 2)], [(0, 1), (1, 1), (2, 1), (2, 2)],
@@ -58,24 +99,493 @@ style = [
     [[(1, 0), (1, 1), (1, 2), (1, 3)], [(0, 1), (1, 1), (2, 1), (3, 1)], [(1, 0), (1, 1), (1, 2), (1, 3)],
      [(0, 1), (1, 1), (2, 1), (3, 1)]]  # I shape (long bar)
 ]
- 
-root = Tk()
-root.title('Tetris')
+
+# (row, col) offsets tried in order when a rotated block does not fit where it is
+KICKS = [(0, 0), (0, -1), (0, 1), (-1, 0)]
+LONG_KICKS = KICKS + [(0, -2), (0, 2)]  # The long bar can be pushed two columns
+
+
+# Precomputed data of one block orientation: its cells, bounding box, one column
+# bitmask per row of the box (shifted so that the left edge is bit 0) and the
+# wall kick offsets tried when rotating into it
+class ShapeInfo(object):
+    def __init__(self, cells, kicks):
+        self.cells = cells
+        self.top = min(x for x, y in cells)
+        self.bottom = max(x for x, y in cells)
+        self.left = min(y for x, y in cells)
+        self.right = max(y for x, y in cells)
+        self.masks = [0] * (self.bottom - self.top + 1)
+        for x, y in cells:
+            self.masks[x - self.top] |= 1 << (y - self.left)
+        self.kicks = kicks
+
+
+# SHAPES[shape][rotation] holds the ShapeInfo of every orientation in style
+SHAPES = [[ShapeInfo(cells, LONG_KICKS if shape == 6 else KICKS) for cells in rotations]
+          for shape, rotations in enumerate(style)]
+
+
+# The falling block: shape index and rotation index into style, plus the
+# (px, py) reference point of its top-left corner on the board
+class Piece(object):
+    def __init__(self, shape, rotation, px, py):
+        self.shape = shape
+        self.rotation = rotation
+        self.px = px
+        self.py = py
+
+    # (row, col) cells covered by the block
+    def Cells(self):
+        return [(x + self.px, y + self.py) for x, y in SHAPES[self.shape][self.rotation].cells]
+
+    # A copy of the block shifted by (dx, dy) and rotated by dr steps
+    def Moved(self, dx, dy, dr=0):
+        return Piece(self.shape, (self.rotation + dr) % 4, self.px + dx, self.py + dy)
+
+
+# Headless game board: each row is stored as one integer bitmask of WIDTH bits,
+# bit j set means column j of that row is occupied by a locked block
+class TetrisBoard(object):
+    def __init__(self, height=HEIGHT, width=WIDTH):
+        self.height = height
+        self.width = width
+        self.rows = [0] * height
+        self.counts = [0] * height  # Number of occupied cells in each row
+
+    # An independent copy of the board
+    def Copy(self):
+        board = TetrisBoard(self.height, self.width)
+        board.rows = self.rows[:]
+        board.counts = self.counts[:]
+        return board
+
+    # Empty the whole board
+    def Reset(self):
+        self.rows = [0] * self.height
+        self.counts = [0] * self.height
+
+    # Check whether a single cell is occupied
+    def IsFilled(self, i, j):
+        return (self.rows[i] >> j) & 1
+
+    # Check whether a block orientation fits with its reference point at (px, py),
+    # testing one row bitmask per row of its bounding box
+    def FitsAt(self, info, px, py):
+        top = px + info.top
+        shift = py + info.left
+        if top < 0 or px + info.bottom >= self.height or shift < 0 or py + info.right >= self.width:
+            return FALSE
+        rows = self.rows
+        for k, mask in enumerate(info.masks):
+            if rows[top + k] & (mask << shift):
+                return FALSE
+        return TRUE
+
+    # Check whether a block can stand at its current position
+    def Fits(self, piece):
+        return self.FitsAt(SHAPES[piece.shape][piece.rotation], piece.px, piece.py)
+
+    # Number of rows a block can fall before it lands
+    def DropDistance(self, piece):
+        info = SHAPES[piece.shape][piece.rotation]
+        d = max(0, self.Top() - 1 - piece.px - info.bottom)  # Rows above the stack are free
+        while self.FitsAt(info, piece.px + d + 1, piece.py):
+            d += 1
+        return d
+
+    # The block turned by one step, pushed by the first wall kick that makes it fit,
+    # or None if it cannot rotate
+    def Rotate(self, piece):
+        rotation = (piece.rotation + 1) % 4
+        info = SHAPES[piece.shape][rotation]
+        for dx, dy in info.kicks:
+            if self.FitsAt(info, piece.px + dx, piece.py + dy):
+                return Piece(piece.shape, rotation, piece.px + dx, piece.py + dy)
+        return None
+
+    # Lock the given free (row, col) cells into the board and return the touched rows
+    def Place(self, cells):
+        for i, j in cells:
+            self.rows[i] |= 1 << j
+            self.counts[i] += 1
+        return sorted(set(i for i, j in cells))
+
+    # Indices of the completely filled rows among the given ones (all rows by default), from top to bottom
+    def FullRows(self, rows=None):
+        if rows is None:
+            rows = range(self.height)
+        return [i for i in rows if self.counts[i] == self.width]
+
+    # Index of the highest row holding any block, or height for an empty board
+    def Top(self):
+        for i in range(self.height):
+            if self.counts[i]:
+                return i
+        return self.height
+
+    # Remove the filled rows in one compaction pass and shift the rows above them down
+    def ClearLines(self, cleared=None):
+        if cleared is None:
+            cleared = self.FullRows()
+        if cleared:
+            gone = set(cleared)
+            kept = [i for i in range(self.height) if i not in gone]
+            self.rows = [0] * len(cleared) + [self.rows[i] for i in kept]
+            self.counts = [0] * len(cleared) + [self.counts[i] for i in kept]
+        return cleared
+
+
+# Draws the game grid and the next block preview on a single Canvas with one
+# rectangle item per cell. Colour changes are buffered and only the cells that
+# differ from the last drawn frame are sent to Tk, once per idle callback
+class CanvasRenderer(object):
+    def __init__(self, master, height, width, backg, nextg):
+        self.height = height
+        self.width = width
+        self.canvas = Canvas(master, width=(width + 5) * CELL, height=height * CELL,
+                             bg='black', highlightthickness=0)
+
+        self.shown = {}    # Item id -> colour currently drawn
+        self.pending = {}  # Item id -> colour to draw at the next flush
+        self.scheduled = FALSE
+        self.onflush = None  # Called after every flush, used by the profiler
+
+        # Rectangle items of the main grid and of the 4x4 preview area
+        self.cells = [[self.Rect(j * CELL, i * CELL, backg) for j in range(width)] for i in range(height)]
+        left = (width + 1) * CELL
+        self.preview = [[self.Rect(left + j * CELL, i * CELL, nextg) for j in range(4)] for i in range(4)]
+
+    # Create one cell rectangle with its top-left corner at (x, y)
+    def Rect(self, x, y, colour):
+        item = self.canvas.create_rectangle(x, y, x + CELL - 1, y + CELL - 1, fill=colour, outline='black')
+        self.shown[item] = colour
+        return item
+
+    # Set the colour of a grid cell
+    def SetCell(self, i, j, colour):
+        self.Paint(self.cells[i][j], colour)
+
+    # Set the colour of a preview cell
+    def SetNext(self, i, j, colour):
+        self.Paint(self.preview[i][j], colour)
+
+    # Queue a colour change and make sure a flush is scheduled
+    def Paint(self, item, colour):
+        self.pending[item] = colour
+        if self.scheduled == FALSE:
+            self.scheduled = TRUE
+            self.canvas.after_idle(self.Flush)
+
+    # Send all queued changes that differ from the drawn frame to Tk
+    def Flush(self):
+        self.scheduled = FALSE
+        shown = self.shown
+        for item, colour in self.pending.items():
+            if shown[item] != colour:
+                self.canvas.itemconfigure(item, fill=colour)
+                shown[item] = colour
+        self.pending.clear()
+        if self.onflush is not None:
+            self.onflush()
+
+
+# Records how long the game handlers take, how late the timer fires and how long
+# a keypress takes to reach the screen. Every measurement is kept in a ring
+# buffer of the last PROFILE_SAMPLES values, in milliseconds
+class FrameProfiler(object):
+    def __init__(self, size=PROFILE_SAMPLES):
+        self.size = size
+        self.handlers = collections.OrderedDict()  # Handler name -> durations
+        self.jitter = collections.deque(maxlen=size)   # Timer period actually seen minus the nominal one
+        self.latency = collections.deque(maxlen=size)  # Keypress to the next repaint
+        self.lastTick = None
+        self.period = None    # Nominal period the next tick was scheduled with
+        self.keyTime = None   # Time of the oldest keypress not yet repainted
+        self.renderer = None  # CanvasRenderer whose flushes count as repaints
+
+    # Wrap a handler so that every call records its duration under name
+    def Timed(self, name, handler):
+        samples = self.handlers.setdefault(name, collections.deque(maxlen=self.size))
+
+        @functools.wraps(handler)
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                samples.append((time.perf_counter() - start) * 1000)
+        return timed
+
+    # Measure the input latency up to the flushes of a renderer
+    def Watch(self, renderer):
+        self.renderer = renderer
+        renderer.onflush = self.Repainted
+
+    # Wrap a key handler so that the time of the keypress is remembered until the next repaint.
+    # A key that queued no repaint (blocked by a wall, before the start, during a flash) is
+    # forgotten, otherwise its wait until the next gravity step would count as latency
+    def Key(self, handler):
+        @functools.wraps(handler)
+        def pressed(event):
+            first = self.keyTime is None
+            if first:
+                self.keyTime = time.perf_counter()
+            try:
+                return handler(event)
+            finally:
+                if first and (self.renderer is None or self.renderer.scheduled == FALSE):
+                    self.keyTime = None
+        return pressed
+
+    # The timer fired: record how far its real period is from the nominal one
+    def Tick(self):
+        now = time.perf_counter()
+        if self.lastTick is not None and self.period is not None:
+            self.jitter.append((now - self.lastTick) * 1000 - self.period)
+        self.lastTick = now
+
+    # The next tick has been scheduled period milliseconds from now
+    def Expect(self, period):
+        self.period = period
+
+    # The canvas has been repainted
+    def Repainted(self):
+        if self.keyTime is not None:
+            self.latency.append((time.perf_counter() - self.keyTime) * 1000)
+            self.keyTime = None
+
+    # Count, mean, 95th percentile and maximum of some samples
+    @staticmethod
+    def Summary(samples):
+        if not samples:
+            return {'count': 0, 'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+        ordered = sorted(samples)
+        return {'count': len(ordered), 'mean': sum(ordered) / len(ordered),
+                'p95': ordered[int(0.95 * (len(ordered) - 1))], 'max': ordered[-1]}
+
+    # Short text for the overlay: mean and maximum of every measurement
+    def Report(self):
+        lines = []
+        series = list(self.handlers.items()) + [('jitter', self.jitter), ('latency', self.latency)]
+        for name, samples in series:
+            summary = self.Summary(samples)
+            lines.append('%-8s%6.1f%7.1f' % (name[:8], summary['mean'], summary['max']))
+        return 'ms        mean    max\n' + '\n'.join(lines)
+
+    # Write all samples and their summaries to a JSON file
+    def Export(self, path=PROFILE_JSON):
+        series = dict((name, list(samples)) for name, samples in self.handlers.items())
+        data = {'handlers': dict((name, {'samples': samples, 'summary': self.Summary(samples)})
+                                 for name, samples in series.items()),
+                'jitter': {'samples': list(self.jitter), 'summary': self.Summary(self.jitter)},
+                'latency': {'samples': list(self.latency), 'summary': self.Summary(self.latency)}}
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+# Milliseconds per row at the given score
+def GravityPeriod(score):
+    period = GRAVITY[0][1]
+    for minimum, ms in GRAVITY:
+        if score >= minimum:
+            period = ms
+    return period
+
+
+# Play one game without any window, drawing blocks from a generator seeded with
+# seed in the same order as App does. policy(board, piece, nextblock) may return
+# another Piece of the same shape to drop instead (it is placed directly at the
+# spawn row, so it only has to fit there), or None to drop the block where it is.
+# Returns the statistics of the game
+def simulate(seed, policy=None, max_pieces=1000):
+    rng = random.Random(seed)
+    board = TetrisBoard(HEIGHT, WIDTH)
+    stats = {'seed': seed, 'pieces': 0, 'lines': 0, 'score': 0, 'gameover': False, 'clears': [0] * 5}
+
+    shape, rotation = rng.randint(0, 6), rng.randint(0, 3)
+    while stats['pieces'] < max_pieces:
+        piece = Piece(shape, rotation, 0, rng.randint(0, 6))
+        shape, rotation = rng.randint(0, 6), rng.randint(0, 3)  # The next block
+        if not board.Fits(piece):
+            stats['gameover'] = True
+            break
+
+        if policy is not None:
+            target = policy(board, piece, (shape, rotation))
+            if target is not None and board.Fits(target):
+                piece = target
+
+        piece = piece.Moved(board.DropDistance(piece), 0)
+        rows = board.Place(piece.Cells())
+        count = len(board.ClearLines(board.FullRows(rows)))
+        stats['pieces'] += 1
+        stats['lines'] += count
+        stats['score'] += LINE_SCORES[count] * WIDTH
+        stats['clears'][count] += 1
+    return stats
+
+
+# Every landing the block can reach from where it spawned by turning in place,
+# sliding sideways along its row and dropping. Returns a list of
+# (block at the spawn row, board rows after the landing, lines cleared)
+def bot_candidates(board, piece):
+    candidates = []
+    seen = set()
+    for rotation in range(4):
+        info = SHAPES[piece.shape][rotation]
+        if frozenset(info.cells) in seen or not board.FitsAt(info, piece.px, piece.py):
+            continue
+        seen.add(frozenset(info.cells))
+
+        # Columns reachable by sliding left and right from the spawn column
+        columns = [piece.py]
+        for step in (-1, 1):
+            py = piece.py + step
+            while board.FitsAt(info, piece.px, py):
+                columns.append(py)
+                py += step
+
+        for py in columns:
+            start = Piece(piece.shape, rotation, piece.px, py)
+            landed = start.Moved(board.DropDistance(start), 0)
+            after = board.Copy()
+            rows = after.Place(landed.Cells())
+            lines = len(after.ClearLines(after.FullRows(rows)))
+            candidates.append((start, after.rows, lines))
+    return candidates
+
+
+# Heuristic score of every candidate from bot_candidates(), higher is better.
+# Uses one NumPy batch over all candidate boards when NumPy is installed
+def bot_scores(candidates, height=HEIGHT, width=WIDTH):
+    wheight, wlines, wholes, wbump = BOT_WEIGHTS
+    if np is not None:
+        rows = np.array([rows for start, rows, lines in candidates], dtype=np.int64)
+        cells = ((rows[:, :, None] >> np.arange(width)) & 1).astype(bool)  # (candidate, row, column)
+        covered = np.logical_or.accumulate(cells, axis=1)  # Cells at or below the top of their column
+        holes = (covered & ~cells).sum(axis=(1, 2))
+        heights = np.where(covered[:, -1, :], height - cells.argmax(axis=1), 0)
+        bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+        lines = np.array([lines for start, rows, lines in candidates])
+        return (wheight * heights.sum(axis=1) + wlines * lines + wholes * holes + wbump * bumpiness).tolist()
+
+    scores = []
+    for start, rows, lines in candidates:
+        heights = [0] * width
+        holes = 0
+        covered = 0
+        for i, row in enumerate(rows):
+            holes += bin(covered & ~row).count('1')
+            new = row & ~covered  # Columns whose top block is in this row
+            while new:
+                low = new & -new
+                heights[low.bit_length() - 1] = height - i
+                new ^= low
+            covered |= row
+        bumpiness = sum(abs(heights[j] - heights[j + 1]) for j in range(width - 1))
+        scores.append(wheight * sum(heights) + wlines * lines + wholes * holes + wbump * bumpiness)
+    return scores
+
+
+# Policy for simulate() and the App bot mode: the reachable landing with the best
+# heuristic score, returned as the block to drop from the spawn row
+def bot_policy(board, piece, nextblock=None):
+    candidates = bot_candidates(board, piece)
+    if not candidates:
+        return None
+    scores = bot_scores(candidates, board.height, board.width)
+    return candidates[scores.index(max(scores))][0]
+
+
+# Run simulate() for every seed, spread over a pool of worker processes
+# (all CPU cores by default). policy must be a module-level function so it can be pickled
+def simulate_batch(seeds, policy=None, max_pieces=1000, processes=None):
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(simulate, [(seed, policy, max_pieces) for seed in seeds])
+
+
+# Leaderboard kept in SQLite with an index on score, so the top entries are read
+# without scanning every game. Several game processes can append at the same time
+class ScoreStore(object):
+    def __init__(self, path=SCORE_DB, legacy=SCORE_TEXT):
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.execute('PRAGMA journal_mode=WAL')  # Readers do not block the writers
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS scores ('
+                              'id INTEGER PRIMARY KEY, score INTEGER, line INTEGER, time REAL, date TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.Import(legacy)
+
+    # Copy the games of the old text file into the database, only the first time
+    def Import(self, legacy):
+        if not os.path.exists(legacy):
+            return
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')  # Only one process may run the import
+            if self.conn.execute("SELECT 1 FROM meta WHERE key = 'imported'").fetchone():
+                return
+            with open(legacy, 'r') as f:
+                text = f.read().replace('\n', '/n')  # The old rows end with a literal '/n'
+            for record in text.split('/n'):
+                fields = record.split()
+                if len(fields) < 7 or not fields[0].isdigit():  # Skip the head line
+                    continue
+                self.conn.execute('INSERT INTO scores (score, line, time, date) VALUES (?, ?, ?, ?)',
+                                  (int(fields[0]), int(fields[1]), float(fields[2]), ' '.join(fields[6:])))
+            self.conn.execute("INSERT INTO meta VALUES ('imported', ?)", (legacy,))
+
+    # Record one finished game
+    def Add(self, score, line, spent, date):
+        with self.conn:
+            self.conn.execute('INSERT INTO scores (score, line, time, date) VALUES (?, ?, ?, ?)',
+                              (score, line, spent, date))
+
+    # The n best games as (score, line, time, date), ties in the order they were played
+    def Top(self, n=10):
+        return self.conn.execute('SELECT score, line, time, date FROM scores '
+                                 'ORDER BY score DESC, id LIMIT ?', (n,)).fetchall()
+
+    def Close(self):
+        self.conn.close()
+
+
+# One leaderboard row in the columns of SCORE_HEAD
+def FormatScore(score, line, spent, date):
+    return '%-9u%-8u%-8.2f%-14.2f%-13.2f%-14.2f%s' % (
+        score, line, spent,
+        score / spent if spent else 0.0,
+        line / spent if spent else 0.0,
+        float(score) / line if line else 0.0,
+        date)
+
 
 # The main application class inheriting from Frame
 class App(Frame):
-    def __init__(self, master):
+    def __init__(self, master, seed=None):
         Frame.__init__(self)
+
+        # Random generator for the blocks, seed it to replay the same game
+        self.rng = random.Random(seed)
+
+        # Measure the handlers; the key bindings below use the measured versions
+        self.profiler = FrameProfiler()
+        for name in ('Up', 'Left', 'Right', 'Down', 'Space', 'OnTimer', 'JudgeLineFill', 'ClearLines'):
+            setattr(self, name, self.profiler.Timed(name, getattr(self, name)))
+        Key = self.profiler.Key
         
         # Bind keys for movement and control
-        master.bind('<Up>', self.Up)        # Rotate block
-        master.bind('<Left>', self.Left)    # Move block left
-        master.bind('<Right>', self.Right)  # Move block right
-        master.bind('<Down>', self.Down)    # Move block down
-        master.bind('<space>', self.Space)  # Drop block to the bottom
+        master.bind('<Up>', Key(self.Up))        # Rotate block
+        master.bind('<Left>', Key(self.Left))    # Move block left
+        master.bind('<Right>', Key(self.Right))  # Move block right
+        master.bind('<Down>', Key(self.Down))    # Move block down
+        master.bind('<space>', Key(self.Space))  # Drop block to the bottom
         master.bind('<Control-Shift-Key-F12>', self.Play)  # Show info
         master.bind('<Key-P>', self.Pause)  # Pause the game
         master.bind('<Key-S>', self.StartByS)  # Start the game
+        master.bind('<Key-B>', self.ToggleBot)  # Let the bot play
+        master.bind('<F3>', self.ToggleOverlay)  # Show the profiler overlay
         
         # Define RGB color values for various game elements
         self.backg = "#%02x%02x%02x" % (120, 150, 30)  # Background color
@@ -83,6 +593,12 @@ class App(Frame):
         self.nextg = "#%02x%02x%02x" % (150, 100, 100)  # Background for next block preview
         self.flashg = "#%02x%02x%02x" % (210, 130, 100)  # Flash color when line is cleared
         
+        # Canvas with the game grid and the next block preview
+        self.renderer = CanvasRenderer(master, HEIGHT, WIDTH, self.backg, self.nextg)
+        self.renderer.canvas.grid(row=0, column=0, columnspan=6)
+        self.profiler.Watch(self.renderer)
+        self.overlay = None  # Canvas text item of the profiler overlay, None while hidden
+
         # Create labels to display lines cleared, score, and time spent
         self.LineDisplay = Label(master, text='Lines: ', bg='black', fg='red')
         self.Line = Label(master, text='0', bg='black', fg='red')
@@ -90,14 +606,14 @@ class App(Frame):
         self.Score = Label(master, text='0', bg='black', fg='red')
         self.SpendTimeDisplay = Label(master, text='Time: ', bg='black', fg='red')
         self.SpendTime = Label(master, text='0.0', bg='black', fg='red')
-        
-        # Layout the labels on the screen
-        self.LineDisplay.grid(row=HEIGHT - 2, column=WIDTH, columnspan=2)
-        self.Line.grid(row=HEIGHT - 2, column=WIDTH + 2, columnspan=3)
-        self.ScoreDisplay.grid(row=HEIGHT - 1, column=WIDTH, columnspan=2)
-        self.Score.grid(row=HEIGHT - 1, column=WIDTH + 2, columnspan=3)
-        self.SpendTimeDisplay.grid(row=HEIGHT - 4, column=WIDTH, columnspan=2)
-        self.SpendTime.grid(row=HEIGHT - 4, column=WIDTH + 2, columnspan=3)
+
+        # Layout the labels below the canvas
+        self.SpendTimeDisplay.grid(row=1, column=0, sticky=E)
+        self.SpendTime.grid(row=1, column=1, sticky=W)
+        self.LineDisplay.grid(row=1, column=2, sticky=E)
+        self.Line.grid(row=1, column=3, sticky=W)
+        self.ScoreDisplay.grid(row=1, column=4, sticky=E)
+        self.Score.grid(row=1, column=5, sticky=W)
  
         # Initialize time, lines, and score
         self.TotalTime = 0.0
@@ -108,276 +624,222 @@ class App(Frame):
         self.isgameover = FALSE  # Flag for game over
         self.isPause = FALSE     # Flag for pause
         self.isStart = FALSE     # Flag for start
-        self.NextList = []       # Preview area for next block
-        self.NextRowList = []    # Row of blocks in the preview area
+        self.isBot = FALSE       # Flag for the bot placing the blocks
  
-        self.px = 0  # X-coordinate of the block reference point
-        self.py = 0  # Y-coordinate of the block reference point
- 
-        # Render the preview area for the next block
-        r = 0
-        c = 0
-        for k in range(4 * 4):  # Loop through 4x4 preview area
-            LN = Label(master, text='    ', bg=str(self.nextg), fg='white', relief=FLAT, bd=3)
-            LN.grid(row=r, column=WIDTH + c, sticky=N + E + S + W)
-            self.NextRowList.append(LN)
-            c = c + 1
-            if c >= 4:  # Move to next row after 4 columns
-                r = r + 1
-                c = 0
-                self.NextList.append(self.NextRowList)
-                self.NextRowList = []
- 
-        # Render the main game grid
-        self.BlockList = []      # Matrix representing the state of each block
-        self.BlockRowList = []   # Row of blocks in the grid
-        self.LabelList = []      # Matrix of labels representing blocks
-        self.LabelRowList = []   # Row of labels
-        row = 0
-        col = 0
-        for i in range(HEIGHT * WIDTH):  # Loop through the grid
-            L = Label(master, text='    ', bg=str(self.backg), fg='white', relief=FLAT, bd=4)
-            L.grid(row=row, column=col, sticky=N + E + S + W)
-            L.row = row
-            L.col = col
-            L.isactive = PASSIVE  # Set block as passive (inactive)
-            self.BlockRowList.append(0)  # Initialize each grid block to 0
-            self.LabelRowList.append(L)
-            col = col + 1
-            if col >= WIDTH:  # Move to the next row after the column reaches WIDTH
-                row = row + 1
-                col = 0
-                self.BlockList.append(self.BlockRowList)
-                self.LabelList.append(self.LabelRowList)
-                self.BlockRowList = []
-                self.LabelRowList = []
+        self.piece = None  # The falling block, None until the game starts
+        self.ClearJob = None  # Pending line clear while filled rows are flashing
+
+        # Game state that does not depend on Tk
+        self.board = TetrisBoard(HEIGHT, WIDTH)
  
-        # Create or load the file for saving scores
-        fw = open('text.txt', 'a')
-        fw.close()
-        hasHead = FALSE
-        f = open('text.txt', 'r')
-        if f.read(5) == 'score':
-            hasHead = TRUE
-        f.close()
-        self.file = open('text.txt', 'a')
-        if hasHead == FALSE:
-            self.file.write('score    line    time    scorePtime    linePtime    scorePline    date/n')
-            self.file.flush()
+        # Open the leaderboard
+        self.scores = ScoreStore()
  
         # Set the initial speed of the game (delay time in milliseconds)
-        self.time = 1000
+        self.time = GravityPeriod(0)
+        self.lastTick = time.monotonic()  # Clock reading of the previous tick
+        self.gravityDue = 0.0  # Seconds of gravity accumulated since the last row
         self.OnTimer()  # Start the game timer
  
     def __del__(self):
-        # Destructor to close the file
-        pass
+        # Destructor to close the leaderboard
+        self.scores.Close()
  
     # Toggle pause state
     def Pause(self, event):
         self.isPause = 1 - self.isPause  # Toggle between 0 and 1
+
+    # Show or hide the profiler overlay
+    def ToggleOverlay(self, event):
+        if self.overlay is None:
+            self.overlay = self.renderer.canvas.create_text((WIDTH + 1) * CELL, 5 * CELL, anchor=NW,
+                                                            fill='white', font=('Courier', 7), text='')
+            self.UpdateOverlay()
+        else:
+            self.renderer.canvas.delete(self.overlay)
+            self.overlay = None
+
+    # Refresh the overlay text from the profiler
+    def UpdateOverlay(self):
+        if self.overlay is not None:
+            self.renderer.canvas.itemconfigure(self.overlay, text=self.profiler.Report())
+
+    # Write the profiler measurements to PROFILE_JSON
+    def ExportProfile(self):
+        self.profiler.Export(PROFILE_JSON)
+        showinfo('Profile', 'Saved to ' + os.path.abspath(PROFILE_JSON))
+
+    # Toggle bot mode
+    def ToggleBot(self, event):
+        self.isBot = 1 - self.isBot
  
     # Handle block rotation (Up key)
     def Up(self, event):
-        BL = self.BlockList  # Block matrix
-        LL = self.LabelList  # Label matrix
- 
-        Moveable = TRUE  # Flag indicating whether the block can be rotated
- 
-        # Get the current and next style of the block
-        nowStyle = style[self.xnow][(self.ynow)]
-        newStyle = style[self.xnow][(self.ynow + 1) % 4]  # Calculate next rotation
-        self.ynow = (self.ynow + 1) % 4  # Update rotation index
- 
-        print("nowStyle:" + str(nowStyle) + "=====>>newStyle:" + str(newStyle))
- 
-        # Calculate the coordinates for the rotated block
-        SourceList = []
-        DestList = []
- 
-        for i in range(4):  # Loop through each block in the shape
-            SourceList.append([nowStyle[i][0] + self.px, nowStyle[i][1] + self.py])
-            x = newStyle[i][0] + self.px
-            y = newStyle[i][1] + self.py
-            DestList.append([x, y])
- 
-            if x < 0 or x >= HEIGHT or y < 0 or y >= WIDTH:  # Check for boundaries
-                Moveable = FALSE
- 
-        if Moveable == TRUE:  # If the block can be rotated, update the grid
-            for i in range(len(SourceList)):
-                self.Empty(SourceList[i][0], SourceList[i][1])
-            for i in range(len(DestList)):
-                self.Fill(DestList[i][0], DestList[i][1])
- 
+        if self.piece is None:
+            return
+        piece = self.board.Rotate(self.piece)
+        if piece is not None:
+            self.MoveTo(piece)
+
     # Move the block left (Left key)
     def Left(self, event):
-        BL = self.BlockList
-        LL = self.LabelList
-        Moveable = TRUE
-        for i in range(HEIGHT):  # Loop through grid to check if block can move left
-            for j in range(WIDTH):
-                if LL[i][j].isactive == ACTIVE and j - 1 < 0: Moveable = FALSE  # Check boundaries
-                if LL[i][j].isactive == ACTIVE and j - 1 >= 0 and BL[i][j - 1] == 1 and LL[i][
-                    j - 1].isactive == PASSIVE: Moveable = FALSE  # Check if there's a block in the way
-        if Moveable == TRUE:  # If the block can move left, update the grid
-            self.py -= 1
-            for i in range(HEIGHT):
-                for j in range(WIDTH):
-                    if j - 1 >= 0 and LL[i][j].isactive == ACTIVE and BL[i][j - 1] == 0:
-                        self.Fill(i, j - 1)
-                        self.Empty(i, j)
- 
+        if self.piece is not None:
+            self.MoveTo(self.piece.Moved(0, -1))
+
     # Move the block right (Right key)
     def Right(self, event):
-        BL = self.BlockList
-        LL = self.LabelList
-        Moveable = TRUE
-        for i in range(HEIGHT):  # Loop through grid to check if block can move right
-            for j in range(WIDTH):
-                if LL[i][j].isactive == ACTIVE and j + 1 >= WIDTH: Moveable = FALSE  # Check boundaries
-                if LL[i][j].isactive == ACTIVE and j + 1 < WIDTH and BL[i][j + 1] == 1 and LL[i][
-                    j + 1].isactive == PASSIVE: Moveable = FALSE  # Check if there's a block in the way
-        if Moveable == TRUE:  # If the block can move right, update the grid
-            self.py += 1
-            for i in range(HEIGHT - 1, -1, -1):
-                for j in range(WIDTH - 1, -1, -1):
-                    if j + 1 < WIDTH and LL[i][j].isactive == ACTIVE and BL[i][j + 1] == 0:
-                        self.Fill(i, j + 1)
-                        self.Empty(i, j)
- 
+        if self.piece is not None:
+            self.MoveTo(self.piece.Moved(0, 1))
+
     # Move the block down (Down key)
     def Down(self, event):
-        BL = self.BlockList
-        LL = self.LabelList
-        Moveable = TRUE
-        for i in range(HEIGHT):  # Loop through grid to check if block can move down
-            for j in range(WIDTH):
-                if LL[i][j].isactive == ACTIVE and i + 1 >= HEIGHT: Moveable = FALSE  # Check bottom boundary
-                if LL[i][j].isactive == ACTIVE and i + 1 < HEIGHT and BL[i + 1][j] == 1 and LL[i + 1][
-                    j].isactive == PASSIVE: Moveable = FALSE  # Check if there's a block below
-        if Moveable == TRUE and self.isStart:  # If the block can move down, update the grid
-            self.px += 1
-            for i in range(HEIGHT - 1, -1, -1):
-                for j in range(WIDTH - 1, -1, -1):
-                    if i + 1 < HEIGHT and LL[i][j].isactive == ACTIVE and BL[i + 1][j] == 0:
-                        self.Fill(i + 1, j)
-                        self.Empty(i, j)
+        if self.piece is None or not self.isStart:
+            return FALSE
+        Moveable = self.MoveTo(self.piece.Moved(1, 0))
         if Moveable == FALSE:  # If the block can't move down, it becomes passive
-            for i in range(HEIGHT):
-                for j in range(WIDTH):
-                    LL[i][j].isactive = PASSIVE
-            self.JudgeLineFill()  # Check if any lines are filled
-            self.Start()  # Start a new block
-            if self.isgameover == TRUE:
-                showinfo('T_T', 'The game is over!')
-                self.Distroy()
-                return FALSE
-            for i in range(4):
-                for j in range(4):
-                    self.NextEmpty(i, j)
-            self.Rnd()
+            rows = self.board.Place(self.piece.Cells())
+            self.piece = None
+            self.JudgeLineFill(rows)  # Check if any lines are filled, then start a new block
         return Moveable
- 
+
+    # Bring in the next block after the previous one has landed
+    def NextBlock(self):
+        self.Start()  # Start a new block
+        if self.isgameover == TRUE:
+            showinfo('T_T', 'The game is over!')
+            self.Distroy()
+            return
+        for i in range(4):
+            for j in range(4):
+                self.NextEmpty(i, j)
+        self.Rnd()
+
+    # Move the falling block to a new position if it fits on the board,
+    # repainting only the cells that actually change
+    def MoveTo(self, piece):
+        if not self.board.Fits(piece):
+            return FALSE
+        OldCells = set(self.piece.Cells())
+        NewCells = set(piece.Cells())
+        for i, j in OldCells - NewCells:
+            self.Empty(i, j)
+        for i, j in NewCells - OldCells:
+            self.Fill(i, j)
+        self.piece = piece
+        return TRUE
+
     # Drop the block to the bottom (Space key)
     def Space(self, event):
-        while 1:
-            if self.Down(0) == FALSE: break
- 
-    # Game timer to control the speed of block falling
+        if self.piece is None or not self.isStart:
+            return
+        self.MoveTo(self.piece.Moved(self.board.DropDistance(self.piece), 0))
+        self.Down(0)  # Lock the block where it landed
+
+    # Game timer to control the speed of block falling. It keeps its own monotonic
+    # clock and runs one gravity step for every full period that has elapsed,
+    # so slow ticks do not slow the game down
     def OnTimer(self):
-        if self.isStart == TRUE and self.isPause == FALSE:
-            self.TotalTime = self.TotalTime + float(self.time) / 1000
-            self.SpendTime.config(text=str(self.TotalTime))
- 
-        if self.isPause == FALSE:
-            self.Down(0)
-        
+        self.profiler.Tick()
+        now = time.monotonic()
+        elapsed = now - self.lastTick
+        self.lastTick = now
+
         # Increase falling speed as score increases
-        if self.TotalScore >= 1000: self.time = 900
-        if self.TotalScore >= 2000: self.time = 750
-        if self.TotalScore >= 3000: self.time = 600
-        if self.TotalScore >= 4000: self.time = 400
-        
-        self.after(self.time, self.OnTimer)  # Recursively call OnTimer to update the timer
- 
-    # Check and remove filled lines
-    def JudgeLineFill(self):
-        BL = self.BlockList
-        LL = self.LabelList
-        count = 0
-        LineList = [1] * WIDTH  # A list representing a fully filled line
+        self.time = GravityPeriod(self.TotalScore)
+        period = self.time / 1000.0
+
+        if self.isStart == TRUE and self.isPause == FALSE:
+            self.TotalTime = self.TotalTime + elapsed
+            self.SpendTime.config(text='%.1f' % self.TotalTime)
+
+            self.gravityDue = self.gravityDue + elapsed
+            steps = 0
+            while self.gravityDue >= period and steps < MAX_CATCHUP:
+                self.Down(0)
+                self.gravityDue = self.gravityDue - period
+                steps = steps + 1
+            if self.gravityDue >= period:  # Forget the steps beyond MAX_CATCHUP
+                self.gravityDue = 0.0
+
+        # Wake up at the next gravity step, or earlier to refresh the clock
+        delay = max(1, min(MAX_TICK, int((period - self.gravityDue) * 1000)))
+        self.UpdateOverlay()
+        self.after(delay, self.OnTimer)  # Recursively call OnTimer to update the timer
+        self.profiler.Expect(delay)
+ 
+    # Check the rows touched by the landed block and remove the filled ones.
+    # The filled rows flash first; the game waits for the flash without blocking Tk
+    def JudgeLineFill(self, rows):
+        FullRows = self.board.FullRows(rows)
+        if not FullRows:
+            self.NextBlock()
+            return
         # Display a flash effect when a line is filled
-        for i in range(HEIGHT):
-            if BL[i] == LineList:
-                count = count + 1
-                for k in range(WIDTH):
-                    LL[i][k].config(bg=str(self.flashg))
-                    LL[i][k].update()
-        if count != 0: self.after(100)
-        
-        # Remove the filled line and update the grid
-        for i in range(HEIGHT):
-            if BL[i] == LineList:
-                for j in range(i, 0, -1):
-                    for k in range(WIDTH):
-                        BL[j][k] = BL[j - 1][k]
-                        LL[j][k]['relief'] = LL[j - 1][k].cget('relief')
-                        LL[j][k]['bg'] = LL[j - 1][k].cget('bg')
-                for l in range(WIDTH):
-                    BL[0][l] = 0
-                    LL[0][l].config(relief=FLAT, bg=str(self.backg))
-        
+        for i in FullRows:
+            for k in range(WIDTH):
+                self.renderer.SetCell(i, k, self.flashg)
+        self.ClearJob = self.after(100, self.ClearLines, FullRows)
+
+    # Remove the filled lines once the flash is over and update the score
+    def ClearLines(self, FullRows):
+        self.ClearJob = None
+        count = len(FullRows)
+
+        # Only the rows between the top of the stack and the lowest cleared line change
+        top = self.board.Top()
+        self.board.ClearLines(FullRows)
+        for i in range(top, FullRows[-1] + 1):
+            self.RedrawRow(i)
+
         # Update score based on the number of lines cleared
         self.TotalLine = self.TotalLine + count
-        if count == 1: self.TotalScore = self.TotalScore + 1 * WIDTH
-        if count == 2: self.TotalScore = self.TotalScore + 3 * WIDTH
-        if count == 3: self.TotalScore = self.TotalScore + 6 * WIDTH
-        if count == 4: self.TotalScore = self.TotalScore + 10 * WIDTH
+        self.TotalScore = self.TotalScore + LINE_SCORES[count] * WIDTH
         self.Line.config(text=str(self.TotalLine))
         self.Score.config(text=str(self.TotalScore))
- 
+        self.NextBlock()
+
+    # Redraw one grid row from the board state
+    def RedrawRow(self, i):
+        for j in range(WIDTH):
+            if self.board.IsFilled(i, j):
+                self.Fill(i, j)
+            else:
+                self.Empty(i, j)
+
     # Fill a block on the grid
     def Fill(self, i, j):
         if j < 0: return
-        if self.BlockList[i][j] == 1: self.isgameover = TRUE
-        self.BlockList[i][j] = 1
-        self.LabelList[i][j].isactive = ACTIVE
-        self.LabelList[i][j].config(relief=RAISED, bg=str(self.frontg))
- 
+        self.renderer.SetCell(i, j, self.frontg)
+
     # Empty a block on the grid
     def Empty(self, i, j):
-        self.BlockList[i][j] = 0
-        self.LabelList[i][j].isactive = PASSIVE
-        self.LabelList[i][j].config(relief=FLAT, bg=str(self.backg))
- 
+        self.renderer.SetCell(i, j, self.backg)
+
     # Show info about the game
     def Play(self, event):
         showinfo('Made in China', '^_^')
  
     # Fill a block in the next block preview area
     def NextFill(self, i, j):
-        self.NextList[i][j].config(relief=RAISED, bg=str(self.frontg))
+        self.renderer.SetNext(i, j, self.frontg)
  
     # Empty a block in the next block preview area
     def NextEmpty(self, i, j):
-        self.NextList[i][j].config(relief=FLAT, bg=str(self.nextg))
+        self.renderer.SetNext(i, j, self.nextg)
  
     # Destroy the current game state and reset the game
     def Distroy(self):
-        # Save the score to file
+        # Save the score to the leaderboard
         if self.TotalScore != 0:
-            savestr = '%-9u%-8u%-8.2f%-14.2f%-13.2f%-14.2f%s/n' % (
-                self.TotalScore, self.TotalLine, self.TotalTime,
-                self.TotalScore / self.TotalTime,
-                self.TotalLine / self.TotalTime,
-                float(self.TotalScore) / self.TotalLine,
-                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
-            self.file.seek(0, 2)
-            self.file.write(savestr)
-            self.file.flush()
+            self.scores.Add(self.TotalScore, self.TotalLine, self.TotalTime,
+                            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
  
         # Reset all blocks and stats
+        if self.ClearJob is not None:  # Drop a line clear that is still flashing
+            self.after_cancel(self.ClearJob)
+            self.ClearJob = None
+        self.board.Reset()
+        self.piece = None
         for i in range(HEIGHT):
             for j in range(WIDTH):
                 self.Empty(i, j)
@@ -389,62 +851,58 @@ class App(Frame):
         self.SpendTime.config(text=str(self.TotalTime))
         self.isgameover = FALSE
         self.isStart = FALSE
-        self.time = 1000
+        self.time = GravityPeriod(0)
+        self.gravityDue = 0.0
         for i in range(4):
             for j in range(4):
                 self.NextEmpty(i, j)
  
     # Start a new block
     def Start(self):
-        nextStyle = style[self.x][self.y]  # Get the style of the next block
-        self.xnow = self.x
-        self.ynow = self.y  # Record the block's position
-        self.py = random.randint(0, 6)
-        print("Assigned random py value:" + str(self.py))
-        self.px = 0
-        for ii in range(4):
-            self.Fill(int(nextStyle[ii][0]), int(nextStyle[ii][1]) + self.py)
+        py = self.rng.randint(0, 6)
+        self.piece = Piece(self.x, self.y, 0, py)  # The next block becomes the falling one
+        if not self.board.Fits(self.piece):  # No room for the new block
+            self.isgameover = TRUE
+        for i, j in self.piece.Cells():
+            self.Fill(i, j)
+        if self.isBot == TRUE and self.isgameover == FALSE:  # Let the bot turn and slide the block
+            target = bot_policy(self.board, self.piece)
+            if target is not None:
+                self.MoveTo(target)
         self.isStart = TRUE  # Game has started
  
     # Select a random block for the next piece
     def Rnd(self):
-        self.x = random.randint(0, 6)
-        self.y = random.randint(0, 3)
+        self.x = self.rng.randint(0, 6)
+        self.y = self.rng.randint(0, 3)
         nextStyle = style[self.x][self.y]  # Get the style of the next block
         for ii in range(4):
             self.NextFill(int(nextStyle[ii][0]), int(nextStyle[ii][1]))
  
     # Select the first block at the start of the game
     def RndFirst(self):
-        self.x = random.randint(0, 6)  # Select a random block style
-        self.y = random.randint(0, 3)
+        self.x = self.rng.randint(0, 6)  # Select a random block style
+        self.y = self.rng.randint(0, 3)
  
     # Show the leaderboard
     def Show(self):
-        self.file.seek(0)
-        strHeadLine = self.file.readline()
-        dictLine = {}
         strTotalLine = ''
-        for OneLine in self.file.readlines():
-            temp = int(OneLine[:5])
-            dictLine[temp] = OneLine
- 
-        list = sorted(dictLine.items(), key=lambda d: d[0])
-        ii = 0
-        for onerecord in reversed(list):
-            ii = ii + 1
-            if ii < 11:
-                strTotalLine += onerecord[1]
-        showinfo('Ranking', strHeadLine + strTotalLine)
+        for onerecord in self.scores.Top(10):
+            strTotalLine += FormatScore(*onerecord) + '\n'
+        showinfo('Ranking', SCORE_HEAD + '\n' + strTotalLine)
  
     # Start the game by pressing 'S'
     def StartByS(self, event):
+        if self.isStart:  # Restarting: end the running game so its blocks and line clear don't linger
+            self.Distroy()
         self.RndFirst()
         self.Start()
         self.Rnd()
  
  
 def Start():
+    if app.isStart:
+        app.Distroy()
     app.RndFirst()
     app.Start()
     app.Rnd()
@@ -454,38 +912,74 @@ def End():
     app.Distroy()
  
  
+def Bot():
+    app.ToggleBot(None)
+
+
 def Set():
     print("Settings function is not complete yet...")
+
+
+def Overlay():
+    app.ToggleOverlay(None)
+
+
+def Profile():
+    app.ExportProfile()
  
  
 def Show():
     app.Show()
  
  
-# Main menu setup
-mainmenu = Menu(root)
-root['menu'] = mainmenu
- 
-# Game menu
-gamemenu = Menu(mainmenu)
-mainmenu.add_cascade(label='Game', menu=gamemenu)
-gamemenu.add_command(label='Start', command=Start)
-gamemenu.add_command(label='End', command=End)
-gamemenu.add_separator()
-gamemenu.add_command(label='Exit', command=root.quit)
- 
-# Settings menu
-setmenu = Menu(mainmenu)
-mainmenu.add_cascade(label='Settings', menu=setmenu)
-setmenu.add_command(label='Settings', command=Set)
- 
-# Show menu
-showmenu = Menu(mainmenu)
-mainmenu.add_cascade(label='Leaderboard', menu=showmenu)
-showmenu.add_command(label='Show', command=Show)
- 
-# Instantiate the App class and start the game
-app = App(root)
+# Main execution
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tetris')
+    parser.add_argument('--simulate', type=int, metavar='GAMES', help='play GAMES headless games and print their statistics')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the (first) game')
+    parser.add_argument('--pieces', type=int, default=1000, help='maximum number of blocks per headless game')
+    parser.add_argument('--bot', action='store_true', help='let the bot place the blocks of headless games')
+    args = parser.parse_args()
+
+    if args.simulate:
+        first = args.seed if args.seed is not None else 0
+        policy = bot_policy if args.bot else None
+        results = simulate_batch(range(first, first + args.simulate), policy, args.pieces)
+        for result in results:
+            print('seed %-8d pieces %-8d lines %-8d score %d' % (
+                result['seed'], result['pieces'], result['lines'], result['score']))
+        sys.exit()
+
+    root = Tk()
+    root.title('Tetris')
+
+    # Main menu setup
+    mainmenu = Menu(root)
+    root['menu'] = mainmenu
+
+    # Game menu
+    gamemenu = Menu(mainmenu)
+    mainmenu.add_cascade(label='Game', menu=gamemenu)
+    gamemenu.add_command(label='Start', command=Start)
+    gamemenu.add_command(label='End', command=End)
+    gamemenu.add_command(label='Bot', command=Bot)
+    gamemenu.add_separator()
+    gamemenu.add_command(label='Exit', command=root.quit)
+
+    # Settings menu
+    setmenu = Menu(mainmenu)
+    mainmenu.add_cascade(label='Settings', menu=setmenu)
+    setmenu.add_command(label='Settings', command=Set)
+    setmenu.add_command(label='Profiler overlay', command=Overlay)
+    setmenu.add_command(label='Export profile', command=Profile)
+
+    # Show menu
+    showmenu = Menu(mainmenu)
+    mainmenu.add_cascade(label='Leaderboard', menu=showmenu)
+    showmenu.add_command(label='Show', command=Show)
+
+    # Instantiate the App class and start the game
+    app = App(root, args.seed)
 
-# Enter the Tkinter main loop to run the game
-root.mainloop()
+    # Enter the Tkinter main loop to run the game
+    root.mainloop()
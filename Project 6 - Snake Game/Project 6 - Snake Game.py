@@ -22,13 +22,26 @@ Author: Sun Yufei
 Date: 2024-08-26
 """
 
+import argparse
+import asyncio
+import os
 import random
 import pygame
+import struct
 import sys
+import time
+from collections import deque
 from pygame.locals import *
 
+try:
+    import numpy as np  # Optional, only needed by SnakeBatchEnv
+except ImportError:
+    np = None
+
 # Game settings and constants
 Snakespeed = 4  # Speed of the snake
+FPS = 60  # Rate at which input is polled and the screen is updated
+MAX_TURNS = 3  # Direction changes buffered ahead of the snake's moves
 Window_Width = 800  # Width of the game window
 Window_Height = 500  # Height of the game window
 Cell_Size = 20  # Size of each cell in the grid (snake and apple size)
@@ -56,6 +69,19 @@ BLUE_DARK = (0, 0, 150)
 # Background color for the game
 BGCOLOR = Black
 
+# Whether runGame starts with the autopilot steering
+AUTOPILOT = False
+
+# Directory runGame saves a replay of every game in (None to not record)
+REPLAY_DIR = 'replays'
+
+# Board size (width, height) in cells of the big-map variant, None for a board
+# that fits the window. A big map is seen through a camera the size of the window
+WORLD_SIZE = None
+WORLD_APPLES = None  # Apples on the big map at once (None for one per 400 cells)
+CHUNK_SIZE = 32  # Width and height in cells of the chunks a big map is stored in
+CAMERA_MARGIN = 8  # Cells the camera keeps between the head and the window edges
+
 # Defining directions
 UP = 'up'
 DOWN = 'down'
@@ -65,100 +91,1138 @@ RIGHT = 'right'
 # Index for the head of the snake
 HEAD = 0
 
-# Main function to start the game
-def main():
-    global SnakespeedCLOCK, DISPLAYSURF, BASICFONT
+# Arrow keys and the directions they steer to
+KEY_DIRECTIONS = {K_UP: UP, K_DOWN: DOWN, K_LEFT: LEFT, K_RIGHT: RIGHT}
+
+# Cell offset (dx, dy) of one step in each direction
+MOVES = {UP: (0, -1), DOWN: (0, 1), LEFT: (-1, 0), RIGHT: (1, 0)}
+
+# Cells are packed into one int: y * Cell_W + x
+def packCell(x, y):
+    return y * Cell_W + x
+
+# Unpack a cell into its (x, y) coordinates
+def cellXY(cell):
+    return cell % Cell_W, cell // Cell_W
+
+# The snake's body as a deque of packed cells (head first) plus an occupancy
+# bitmap of the board, so moving, growing and self-collision checks are all O(1).
+# The free cells are kept in a list with each cell's index in it, so a cell is
+# added or removed by swapping with the last entry and a free cell is sampled in O(1)
+class Worm:
+    def __init__(self, cells):
+        self.body = deque(cells)
+        self.occupied = bytearray(Cell_W * Cell_H)
+        self.free = list(range(Cell_W * Cell_H))  # Every cell not under the snake
+        self.slot = list(range(Cell_W * Cell_H))  # Index of each free cell in self.free
+        self.vacated = None  # Cell the tail left on the last move, if any
+        for cell in cells:
+            self.occupy(cell)
+
+    # Mark a cell as taken by the snake and drop it from the free list
+    def occupy(self, cell):
+        self.occupied[cell] = 1
+        i = self.slot[cell]
+        last = self.free.pop()
+        if last != cell:
+            self.free[i] = last
+            self.slot[last] = i
+
+    # Give a cell back to the free list
+    def vacate(self, cell):
+        self.occupied[cell] = 0
+        self.slot[cell] = len(self.free)
+        self.free.append(cell)
+
+    # A uniformly chosen cell not under the snake, or None if the board is full
+    def randomFreeCell(self, rng=random):
+        if not self.free:
+            return None
+        return self.free[rng.randrange(len(self.free))]
+
+    # The packed cell of the head
+    def head(self):
+        return self.body[HEAD]
+
+    # Move the head onto cell, keeping the tail when growing.
+    # Returns False if the head runs into the body
+    def move(self, cell, grow):
+        self.vacated = None
+        if not grow:
+            self.vacated = self.body.pop()  # The tail moves out of the way first
+            self.vacate(self.vacated)
+        if self.occupied[cell]:
+            return False
+        self.body.appendleft(cell)
+        self.occupy(cell)
+        return True
+
+# Directions that would reverse the snake onto itself
+OPPOSITE = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}
+
+# The game rules without any display or input: reset() starts a new game and
+# step(direction) advances it by one move. Used by runGame and for headless runs
+class SnakeEnv:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.reset()
+
+    # Start a new game with a 3-segment snake heading right
+    def reset(self):
+        startx = self.rng.randint(5, Cell_W - 6)
+        starty = self.rng.randint(5, Cell_H - 6)
+        self.worm = Worm([packCell(startx, starty), packCell(startx - 1, starty),
+                          packCell(startx - 2, starty)])
+        self.direction = RIGHT
+        self.apple = self.worm.randomFreeCell(self.rng)
+        self.score = 0
+        self.done = False
+        return self
+
+    # Turn towards direction (ignored if it would reverse the snake, None keeps going)
+    # and move one cell. Returns (reward, done): reward is 1 for eating the apple,
+    # -1 for dying and 0 otherwise
+    def step(self, direction=None):
+        if self.done:
+            return 0, True
+        if direction is not None and direction != OPPOSITE[self.direction]:
+            self.direction = direction
+
+        # Work out where the head moves in the current direction
+        x, y = cellXY(self.worm.head())
+        dx, dy = MOVES[self.direction]
+        x, y = x + dx, y + dy
+
+        # Check if the snake has hit the edge of the board
+        if x == -1 or x == Cell_W or y == -1 or y == Cell_H:
+            self.done = True
+            return -1, True
+        newHead = packCell(x, y)
+
+        # Don't remove the tail when the snake eats the apple
+        ateApple = newHead == self.apple
+        if not self.worm.move(newHead, ateApple):
+            self.done = True
+            return -1, True  # The snake collided with itself
+        if ateApple:
+            self.score += 1
+            self.apple = self.worm.randomFreeCell(self.rng)  # Generate a new apple location
+            if self.apple is None:
+                self.done = True  # The snake fills the whole board
+            return 1, self.done
+        return 0, False
+
+    # Everything needed to carry on the game from this point, see restore()
+    def snapshot(self):
+        return (tuple(self.worm.body), tuple(self.worm.free), self.direction, self.apple,
+                self.score, self.done, self.rng.getstate())
+
+    # Go back to a state taken by snapshot(). The free list is restored in
+    # its exact order so the following apples land in the same cells
+    def restore(self, state):
+        body, free, self.direction, self.apple, self.score, self.done, rngState = state
+        self.worm = Worm(body)
+        self.worm.free = list(free)
+        for i, cell in enumerate(free):
+            self.worm.slot[cell] = i
+        self.rng.setstate(rngState)
+        return self
+
+# Direction codes of SnakeBatchEnv actions
+DIRECTIONS = [UP, DOWN, LEFT, RIGHT]
+
+# Many independent games advanced together with NumPy array operations.
+# Instead of a deque, every game stores the tick at which the head entered each
+# cell: a cell belongs to the body while it was entered within the last
+# length ticks, so moving, growing and collision checks are single array
+# lookups. Finished games are reset straight away
+class SnakeBatchEnv:
+    def __init__(self, games, seed=None):
+        if np is None:
+            raise ImportError('SnakeBatchEnv needs NumPy')
+        self.games = games
+        self.rng = np.random.default_rng(seed)
+        self.tick = 0
+        self.entered = np.empty((games, Cell_W * Cell_H), dtype=np.int64)
+        self.headx = np.empty(games, dtype=np.int64)
+        self.heady = np.empty(games, dtype=np.int64)
+        self.direction = np.empty(games, dtype=np.int64)
+        self.length = np.empty(games, dtype=np.int64)
+        self.apple = np.empty(games, dtype=np.int64)
+        self.score = np.zeros(games, dtype=np.int64)
+        self.reset()
+
+    # Start new games, all of them by default, or those where the mask is set
+    def reset(self, mask=None):
+        index = np.arange(self.games) if mask is None else np.flatnonzero(mask)
+        n = len(index)
+        if n == 0:
+            return
+        startx = self.rng.integers(5, Cell_W - 5, n)
+        starty = self.rng.integers(5, Cell_H - 5, n)
+        self.entered[index] = -(1 << 62)  # Entered long ago: free
+        for age in range(3):  # Tail two ticks ago, head now
+            self.entered[index, starty * Cell_W + startx - age] = self.tick - age
+        self.headx[index] = startx
+        self.heady[index] = starty
+        self.direction[index] = DIRECTIONS.index(RIGHT)
+        self.length[index] = 3
+        self.score[index] = 0
+        self.placeApples(index)
+
+    # Put a new apple on a uniformly chosen free cell of every game in index
+    def placeApples(self, index):
+        free = self.entered[index] <= self.tick - self.length[index, None]
+        weights = self.rng.random(free.shape)
+        weights[~free] = -1.0
+        self.apple[index] = weights.argmax(axis=1)
+
+    # Advance every game by one move. actions holds one DIRECTIONS index per
+    # game (turns that would reverse the snake are ignored). Returns the
+    # (rewards, dones) arrays with the same meaning as SnakeEnv.step
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        opposite = np.array([DIRECTIONS.index(OPPOSITE[d]) for d in DIRECTIONS])
+        turn = actions != opposite[self.direction]
+        self.direction = np.where(turn, actions, self.direction)
+
+        dx = np.array([MOVES[d][0] for d in DIRECTIONS])[self.direction]
+        dy = np.array([MOVES[d][1] for d in DIRECTIONS])[self.direction]
+        x = self.headx + dx
+        y = self.heady + dy
+        self.tick += 1
+        rows = np.arange(self.games)
+
+        wall = (x < 0) | (x >= Cell_W) | (y < 0) | (y >= Cell_H)
+        cell = np.clip(y, 0, Cell_H - 1) * Cell_W + np.clip(x, 0, Cell_W - 1)
+        ate = ~wall & (cell == self.apple)
+        self.length += ate  # Growing keeps the tail where it is
+        hit = self.entered[rows, cell] > self.tick - self.length
+        dead = wall | hit
+
+        alive = ~dead
+        self.entered[rows[alive], cell[alive]] = self.tick
+        self.headx = np.where(alive, x, self.headx)
+        self.heady = np.where(alive, y, self.heady)
+        self.score += ate
+
+        rewards = ate.astype(np.int64) - dead
+        full = ate & (self.length >= Cell_W * Cell_H)  # The snake fills the whole board
+        dones = dead | full
+        eaten = np.flatnonzero(ate & ~full)
+        if len(eaten):
+            self.placeApples(eaten)
+        self.reset(dones)
+        return rewards, dones
+
+# Neighbouring cells of every cell on the board, with the direction leading to each
+NEIGHBOURS = []
+for _cell in range(Cell_W * Cell_H):
+    _x, _y = _cell % Cell_W, _cell // Cell_W
+    NEIGHBOURS.append([(packCell(_x + dx, _y + dy), direction) for direction, (dx, dy) in MOVES.items()
+                       if 0 <= _x + dx < Cell_W and 0 <= _y + dy < Cell_H])
+
+# A cycle through every cell of the board, as the list of cells in cycle order.
+# Needs an even width or height; returns None otherwise
+def hamiltonianCycle():
+    if Cell_W % 2 == 0:
+        width, height, pack = Cell_W, Cell_H, packCell
+    elif Cell_H % 2 == 0:
+        width, height, pack = Cell_H, Cell_W, lambda x, y: packCell(y, x)  # Build it transposed
+    else:
+        return None
+    # Snake down and up the columns below the top row, then come back along the top row
+    order = []
+    for x in range(width):
+        rows = range(1, height) if x % 2 == 0 else range(height - 1, 0, -1)
+        order.extend(pack(x, y) for y in rows)
+    order.extend(pack(x, 0) for x in range(width - 1, -1, -1))
+    return order
+
+# Steers the snake along a Hamiltonian cycle, taking shortcuts towards the apple.
+# The shortest path to each apple is planned once (and only kept if the snake
+# can still reach its tail after eating), then reused move by move. A move is
+# only taken if, in cycle order, it lands before the apple and well before the
+# tail, so the body stays laid out along the cycle and the snake can't trap
+# itself. Otherwise the snake moves to the free neighbour furthest ahead that
+# obeys the same rule. Without a cycle (odd by odd boards) it follows safe
+# shortest paths and chases its tail in between
+class Autopilot:
+    def __init__(self):
+        self.cycle = hamiltonianCycle()
+        self.position = [0] * (Cell_W * Cell_H)  # Index of every cell in the cycle
+        if self.cycle is not None:
+            for i, cell in enumerate(self.cycle):
+                self.position[cell] = i
+        self.path = deque()  # Planned cells still to walk towards self.target
+        self.target = None
+
+    # Direction for the snake's next move in env
+    def choose(self, env):
+        worm = env.worm
+        head = worm.head()
+
+        # Plan once per apple
+        if self.target != env.apple:
+            self.target = env.apple
+            path = self.shortestPath(head, env.apple, worm.occupied)
+            self.path = deque(path if path is not None and self.isSafe(worm, path) else ())
+
+        if self.cycle is None:
+            if self.path and not worm.occupied[self.path[0]]:
+                return self.directionTo(head, self.path.popleft())
+            self.target = None  # Plan again on the next move
+            return self.chaseTail(worm, head)
+
+        # How far ahead along the cycle the apple and the tail are
+        size = len(self.cycle)
+        start = self.position[head]
+        toApple = (self.position[env.apple] - start) % size
+        toTail = (self.position[worm.body[-1]] - start) % size
+
+        # Moves that keep the body in cycle order, with how far ahead they go
+        moves = {}
+        for cell, direction in NEIGHBOURS[head]:
+            ahead = (self.position[cell] - start) % size
+            if not worm.occupied[cell] and (ahead == 1 or (ahead <= toApple and ahead < toTail - 3)):
+                moves[cell] = (ahead, direction)
+
+        if self.path and self.path[0] in moves:
+            return moves[self.path.popleft()][1]
+        self.path.clear()  # The plan left the cycle order, drop it for this apple
+        if moves:
+            return max(moves.values())[1]
+        return self.chaseTail(worm, head)
+
+    # Move towards the tail, or into any free cell if the tail can't be reached
+    def chaseTail(self, worm, head):
+        path = self.shortestPath(head, worm.body[-1], worm.occupied)
+        if path is not None:
+            return self.directionTo(head, path[0])
+        for cell, direction in NEIGHBOURS[head]:
+            if not worm.occupied[cell]:
+                return direction
+        return None  # Trapped, keep going
+
+    # Direction of the move from a cell to its neighbour
+    @staticmethod
+    def directionTo(cell, neighbour):
+        for other, direction in NEIGHBOURS[cell]:
+            if other == neighbour:
+                return direction
+
+    # Breadth-first search over cells not marked in blocked (goal may be blocked).
+    # Returns the cells from start (excluded) to goal, or None if it can't be reached
+    @staticmethod
+    def shortestPath(start, goal, blocked):
+        parent = {start: None}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            for other, direction in NEIGHBOURS[cell]:
+                if other in parent or (blocked[other] and other != goal):
+                    continue
+                parent[other] = cell
+                if other == goal:
+                    path = []
+                    while other != start:
+                        path.append(other)
+                        other = parent[other]
+                    path.reverse()
+                    return path
+                queue.append(other)
+        return None
+
+    # Whether the snake can still reach its tail after walking the path and eating at its end
+    def isSafe(self, worm, path):
+        body = deque(worm.body)
+        occupied = bytearray(worm.occupied)
+        for i, cell in enumerate(path):
+            if i < len(path) - 1:  # The snake grows on the last cell
+                occupied[body.pop()] = 0
+            body.appendleft(cell)
+            occupied[cell] = 1
+        return self.shortestPath(body[HEAD], body[-1], occupied) is not None
+
+# Code of each direction in DIRECTIONS, as stored in replays
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+# Replay file header: magic, version, board width and height, seed and number of moves.
+# It is followed by the moves as runs of the same direction, one varint per run
+# holding the run length shifted left by two bits and the direction code
+REPLAY_MAGIC = b'SNKR'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<4sBHHQI')
+
+# Moves between the snapshots a Replay keeps to rebuild frames from
+SNAPSHOT_EVERY = 256
+
+# A recorded game: the seed of its SnakeEnv and the direction of every move.
+# On creation the game is played through once, keeping a snapshot every
+# SNAPSHOT_EVERY moves, so frame() rebuilds any point of the game from the
+# snapshot before it in at most SNAPSHOT_EVERY moves, however long the game is
+class Replay:
+    def __init__(self, seed, moves):
+        self.seed = seed
+        self.moves = moves  # bytearray of direction codes, one per move
+        self.snapshots = []
+        env = SnakeEnv(seed)
+        for tick in range(len(moves) + 1):
+            if tick % SNAPSHOT_EVERY == 0:
+                self.snapshots.append(env.snapshot())
+            if tick < len(moves):
+                env.step(DIRECTIONS[moves[tick]])
+
+    # The game after its first tick moves
+    def frame(self, tick):
+        env = SnakeEnv().restore(self.snapshots[tick // SNAPSHOT_EVERY])
+        for code in self.moves[tick - tick % SNAPSHOT_EVERY:tick]:
+            env.step(DIRECTIONS[code])
+        return env
+
+    # Write a game as its header and the run-length-encoded moves
+    @staticmethod
+    def save(path, seed, moves):
+        data = bytearray(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, Cell_W, Cell_H, seed, len(moves)))
+        start = 0
+        while start < len(moves):
+            end = start + 1
+            while end < len(moves) and moves[end] == moves[start]:
+                end += 1
+            value = (end - start) << 2 | moves[start]
+            while value >= 0x80:  # Seven bits per byte, the high bit marks more to come
+                data.append(value & 0x7f | 0x80)
+                value >>= 7
+            data.append(value)
+            start = end
+        with open(path, 'wb') as file:
+            file.write(data)
+
+    # Read a file written by save()
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < REPLAY_HEADER.size:
+            raise ValueError('%s is not a Snake replay' % path)
+        magic, version, width, height, seed, count = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError('%s is not a Snake replay' % path)
+        if (width, height) != (Cell_W, Cell_H):
+            raise ValueError('%s was recorded on a %dx%d board' % (path, width, height))
+
+        moves = bytearray()
+        value = shift = 0
+        for byte in data[REPLAY_HEADER.size:]:
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                moves.extend(bytes([value & 3]) * (value >> 2))
+                value = shift = 0
+        if len(moves) != count:
+            raise ValueError('%s is truncated' % path)
+        return cls(seed, moves)
+
+# One CHUNK_SIZE x CHUNK_SIZE square of a World: the snake cells and apples in it
+class Chunk:
+    __slots__ = ('snake', 'apples')
+
+    def __init__(self):
+        self.snake = set()
+        self.apples = set()
+
+# Stands in for the chunks that don't exist yet when looking cells up, never written to
+EMPTY_CHUNK = Chunk()
+
+# A board of any size, stored as chunks that are only created once something
+# lands in them: lookups go through lookup(), which never creates one. Every
+# lookup touches a single chunk, and drawing only the chunks under the camera
+# keeps its cost independent of the board's area
+class World:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.across = -(-width // CHUNK_SIZE)  # Chunks per row
+        self.chunks = [None] * (self.across * -(-height // CHUNK_SIZE))
+
+    # The chunk holding cell (x, y), created if needed, to put something in it
+    def chunk(self, x, y):
+        i = y // CHUNK_SIZE * self.across + x // CHUNK_SIZE
+        chunk = self.chunks[i]
+        if chunk is None:
+            chunk = self.chunks[i] = Chunk()
+        return chunk
+
+    # The chunk holding cell (x, y) to look at, EMPTY_CHUNK if it doesn't exist yet
+    def lookup(self, x, y):
+        return self.chunks[y // CHUNK_SIZE * self.across + x // CHUNK_SIZE] or EMPTY_CHUNK
+
+    # The existing chunks overlapping a width x height area whose top left cell is (left, top)
+    def chunksIn(self, left, top, width, height):
+        for cy in range(top // CHUNK_SIZE, (top + height - 1) // CHUNK_SIZE + 1):
+            for cx in range(left // CHUNK_SIZE, (left + width - 1) // CHUNK_SIZE + 1):
+                chunk = self.chunks[cy * self.across + cx]
+                if chunk is not None:
+                    yield chunk
+
+    # Whether no snake or apple is on cell
+    def isFree(self, cell):
+        chunk = self.lookup(*cell)
+        return cell not in chunk.snake and cell not in chunk.apples
+
+    # Whether an apple is on cell
+    def hasApple(self, cell):
+        return cell in self.lookup(*cell).apples
+
+    # Whether a snake is on cell
+    def hasSnake(self, cell):
+        return cell in self.lookup(*cell).snake
+
+    # The cell one move from cell in direction, or None past the edge of the board
+    def ahead(self, cell, direction):
+        dx, dy = MOVES[direction]
+        x, y = cell[0] + dx, cell[1] + dy
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return x, y
+        return None
+
+    # Put the cells of a new snake on the board
+    def addSnake(self, cells):
+        for cell in cells:
+            self.chunk(*cell).snake.add(cell)
+
+    # Take the cells of a snake off the board
+    def removeSnake(self, cells):
+        for cell in cells:
+            self.chunk(*cell).snake.discard(cell)
+
+    # Move the tail of a snake's body (head first) off the board and return its cell
+    def dropTail(self, body):
+        tail = body.pop()
+        self.chunk(*tail).snake.discard(tail)
+        return tail
+
+    # Move the head of a snake's body onto cell, eating the apple there if any.
+    # Returns whether it ate one
+    def pushHead(self, body, cell):
+        chunk = self.chunk(*cell)
+        body.appendleft(cell)
+        chunk.snake.add(cell)
+        if cell in chunk.apples:
+            chunk.apples.discard(cell)
+            return True
+        return False
+
+    # Put an apple on a random free cell and return it, or None if the board is too crowded to find one
+    def spawnApple(self, rng):
+        cell = self.randomFreeCell(rng)
+        if cell is not None:
+            self.chunk(*cell).apples.add(cell)
+        return cell
+
+    # A random free cell. The snakes and the apples cover a small part of a big
+    # map, so a few random picks find one almost surely; if they don't, the
+    # board is crowded and None is returned
+    def randomFreeCell(self, rng):
+        for _ in range(100):
+            cell = (rng.randrange(self.width), rng.randrange(self.height))
+            if self.isFree(cell):
+                return cell
+        return None
+
+# The game on a World, with many apples at once. Cells are (x, y) tuples.
+# Same interface as SnakeEnv: reset() starts a game and step(direction)
+# returns (reward, done). After each step, vacated is the cell the tail left
+# (or None) and spawned lists the apples placed during the step
+class WorldEnv:
+    def __init__(self, width, height, apples, seed=None):
+        self.rng = random.Random(seed)
+        self.width = width
+        self.height = height
+        self.appleCount = apples
+        self.reset()
+
+    # Start a new game with a 3-segment snake heading right and every apple placed
+    def reset(self):
+        self.world = World(self.width, self.height)
+        startx = self.rng.randint(5, self.width - 6)
+        starty = self.rng.randint(5, self.height - 6)
+        self.body = deque([(startx, starty), (startx - 1, starty), (startx - 2, starty)])
+        self.world.addSnake(self.body)
+        self.direction = RIGHT
+        self.score = 0
+        self.done = False
+        self.vacated = None
+        self.spawned = []
+        for _ in range(self.appleCount):
+            self.spawnApple()
+        return self
+
+    # Put an apple on a random free cell, skipped if the board is too crowded to find one
+    def spawnApple(self):
+        cell = self.world.spawnApple(self.rng)
+        if cell is not None:
+            self.spawned.append(cell)
+
+    # Turn towards direction (ignored if it would reverse the snake, None keeps going)
+    # and move one cell, with the same rewards as SnakeEnv.step
+    def step(self, direction=None):
+        if self.done:
+            return 0, True
+        if direction is not None and direction != OPPOSITE[self.direction]:
+            self.direction = direction
+        self.vacated = None
+        self.spawned = []
+
+        cell = self.world.ahead(self.body[HEAD], self.direction)
+        if cell is None:  # The snake hit the edge of the board
+            self.done = True
+            return -1, True
+
+        ateApple = self.world.hasApple(cell)
+        if not ateApple:
+            self.vacated = self.world.dropTail(self.body)  # The tail moves out of the way first
+        if self.world.hasSnake(cell):
+            self.done = True
+            return -1, True
+        self.world.pushHead(self.body, cell)
+        if ateApple:
+            self.score += 1
+            self.spawnApple()
+            return 1, False
+        return 0, False
+
+# Arena constants: tick rate, default board and the output buffered per client
+# before it counts as too slow and is disconnected
+ARENA_TICK_RATE = 10
+ARENA_SIZE = (200, 200)
+ARENA_MAX_BUFFER = 1 << 20
+ARENA_BACKLOG = 1024  # Connections waiting to be accepted, for many bots connecting at once
+
+# Arena protocol. The client only ever sends single bytes, each the code of a
+# direction in DIRECTIONS to turn to. The server sends messages made of a
+# MESSAGE header (kind, payload length) and a payload, all little-endian:
+#   ARENA_WELCOME   the client's snake id, board width and height, tick rate
+#   ARENA_SNAPSHOT  tick, number of snakes and apples; then every snake as its
+#                   id, length and cells head first; then every apple's cell
+#   ARENA_DIFF      ARENA_DIFF_HEADER, then the lists it counts: tails (id),
+#                   heads (id, x, y), deaths (id), spawns (id, x, y) and apples (x, y)
+# A welcome and a snapshot follow the connection, then one diff every tick.
+# Clients apply a diff's lists in that order: pop the tail of every listed
+# snake, add the new heads (eating any apple there), drop the dead snakes, add
+# the spawned ones as 3 cells heading right from (x, y), then the new apples
+ARENA_WELCOME, ARENA_SNAPSHOT, ARENA_DIFF = 1, 2, 3
+MESSAGE = struct.Struct('<BI')
+WELCOME = struct.Struct('<HHHH')
+SNAPSHOT_HEADER = struct.Struct('<IHI')
+ARENA_DIFF_HEADER = struct.Struct('<IHHHHH')  # Tick and the lengths of the five lists
+
+# A message ready to be written to a client
+def arenaMessage(kind, payload):
+    return MESSAGE.pack(kind, len(payload)) + payload
+
+# Pack a flat list of numbers as little-endian unsigned shorts
+def packShorts(values):
+    return struct.pack('<%dH' % len(values), *values)
+
+# One player of the arena. body is None while waiting to be placed on the board
+class ArenaSnake:
+    __slots__ = ('id', 'body', 'direction', 'turns', 'leaving')
+
+    def __init__(self, id):
+        self.id = id
+        self.body = None
+        self.direction = RIGHT
+        self.turns = deque()  # Direction changes waiting for the next moves
+        self.leaving = False
+
+# Many snakes on one World, with the same rules as SnakeEnv.step: a snake
+# turns (never back onto itself), moves one cell and grows when it eats, and
+# dies on hitting the edge or any snake. All snakes move at once: the tails
+# move out of the way first, and heads running into the same cell all die.
+# Dead snakes are put back on the board in the same step() that killed them,
+# so a tick's deaths and respawns travel in one ARENA_DIFF payload along with
+# every other change of that tick
+class Arena:
+    def __init__(self, width, height, apples, seed=None):
+        self.rng = random.Random(seed)
+        self.world = World(width, height)
+        self.snakes = {}  # Snake id -> ArenaSnake
+        self.freeIds = []  # Ids given back by snakes that left
+        self.nextId = 0
+        self.tick = 0
+        for _ in range(apples):
+            self.world.spawnApple(self.rng)
+
+    # Add a new snake, placed on the board by the next step
+    def join(self):
+        id = self.freeIds.pop() if self.freeIds else self.nextId
+        if id == self.nextId:
+            if id > 0xffff:
+                raise ValueError('the arena is full')
+            self.nextId += 1
+        snake = self.snakes[id] = ArenaSnake(id)
+        return snake
+
+    # Take a snake off the board on the next step
+    def leave(self, snake):
+        snake.leaving = True
+
+    # Queue a turn for a snake's next moves
+    def turn(self, snake, direction):
+        queueTurn(snake.turns, direction, snake.direction)
+
+    # Place a snake with 3 segments heading right on free cells, if any are found
+    def spawnSnake(self, snake):
+        for _ in range(100):
+            x = self.rng.randrange(2, self.world.width - 5)
+            y = self.rng.randrange(self.world.height)
+            cells = [(x, y), (x - 1, y), (x - 2, y)]
+            if all(self.world.isFree(cell) for cell in cells):
+                self.world.addSnake(cells)
+                snake.body = deque(cells)
+                snake.direction = RIGHT
+                snake.turns.clear()
+                return True
+        return False
+
+    # Advance every snake by one move and return what changed as an ARENA_DIFF payload
+    def step(self):
+        self.tick += 1
+        world = self.world
+        tails, heads, deaths, spawns, apples = [], [], [], [], []
+
+        # Work out where every head moves; snakes leaving the game stay put until removed below
+        moves = []
+        dead = [snake for snake in self.snakes.values() if snake.leaving]
+        for snake in self.snakes.values():
+            if snake.body is None or snake.leaving:
+                continue
+            if snake.turns:
+                snake.direction = snake.turns.popleft()
+            cell = world.ahead(snake.body[HEAD], snake.direction)
+            if cell is not None:
+                moves.append((snake, cell))
+            else:
+                dead.append(snake)  # The snake hit the edge of the board
+
+        # The tails move out of the way first, except for the snakes eating an apple
+        targets = {}
+        for snake, cell in moves:
+            targets[cell] = targets.get(cell, 0) + 1
+            if not world.hasApple(cell):
+                world.dropTail(snake.body)
+                tails.append(snake.id)
+
+        # Then the heads move, unless they run into a snake or into another head
+        eaten = 0
+        for snake, cell in moves:
+            if targets[cell] > 1 or world.hasSnake(cell):
+                dead.append(snake)
+                continue
+            eaten += world.pushHead(snake.body, cell)
+            heads.extend((snake.id, cell[0], cell[1]))
+
+        # Clear the dead snakes off the board, and forget the ones that left
+        for snake in dead:
+            if snake.body is not None:
+                world.removeSnake(snake.body)
+                snake.body = None
+            deaths.append(snake.id)
+            if snake.leaving:
+                del self.snakes[snake.id]
+                self.freeIds.append(snake.id)
+
+        # Put every snake that isn't on the board back on it, and replace the eaten apples
+        for snake in self.snakes.values():
+            if snake.body is None and self.spawnSnake(snake):
+                spawns.extend((snake.id,) + snake.body[HEAD])
+        for _ in range(eaten):
+            cell = world.spawnApple(self.rng)
+            if cell is not None:
+                apples.extend(cell)
+
+        return (ARENA_DIFF_HEADER.pack(self.tick, len(tails), len(heads) // 3, len(deaths),
+                                       len(spawns) // 3, len(apples) // 2) +
+                packShorts(tails) + packShorts(heads) + packShorts(deaths) +
+                packShorts(spawns) + packShorts(apples))
+
+    # The whole board as an ARENA_SNAPSHOT payload, for clients joining the game
+    def snapshot(self):
+        onBoard = [snake for snake in self.snakes.values() if snake.body is not None]
+        values = []
+        for snake in onBoard:
+            values.extend((snake.id, len(snake.body)))
+            for cell in snake.body:
+                values.extend(cell)
+        apples = [coordinate for chunk in self.world.chunks if chunk is not None
+                  for cell in chunk.apples for coordinate in cell]
+        return (SNAPSHOT_HEADER.pack(self.tick, len(onBoard), len(apples) // 2) +
+                packShorts(values) + packShorts(apples))
+
+# A client's copy of the arena, kept up to date from the server's messages
+class ArenaMirror:
+    def __init__(self):
+        self.id = None  # Id of this client's snake
+        self.width = self.height = self.tickRate = 0
+        self.tick = 0
+        self.snakes = {}  # Snake id -> deque of cells, head first
+        self.occupied = set()  # Cells of every snake
+        self.apples = set()
+
+    # Update the copy with a message's payload
+    def apply(self, kind, payload):
+        if kind == ARENA_WELCOME:
+            self.id, self.width, self.height, self.tickRate = WELCOME.unpack(payload)
+        elif kind == ARENA_SNAPSHOT:
+            self.tick, snakes, apples = SNAPSHOT_HEADER.unpack_from(payload)
+            values = struct.unpack_from('<%dH' % ((len(payload) - SNAPSHOT_HEADER.size) // 2),
+                                        payload, SNAPSHOT_HEADER.size)
+            self.snakes.clear()
+            self.occupied.clear()
+            i = 0
+            for _ in range(snakes):
+                id, length = values[i], values[i + 1]
+                body = deque(zip(values[i + 2:i + 2 + 2 * length:2], values[i + 3:i + 3 + 2 * length:2]))
+                self.snakes[id] = body
+                self.occupied.update(body)
+                i += 2 + 2 * length
+            self.apples = set(zip(values[i::2], values[i + 1::2]))
+        elif kind == ARENA_DIFF:
+            self.tick, *counts = ARENA_DIFF_HEADER.unpack_from(payload)
+            values = struct.unpack_from('<%dH' % ((len(payload) - ARENA_DIFF_HEADER.size) // 2),
+                                        payload, ARENA_DIFF_HEADER.size)
+            tails, heads, deaths, spawns, apples = counts
+            i = 0
+            for id in values[i:i + tails]:
+                self.occupied.discard(self.snakes[id].pop())
+            i += tails
+            for j in range(i, i + 3 * heads, 3):
+                cell = (values[j + 1], values[j + 2])
+                self.snakes[values[j]].appendleft(cell)
+                self.occupied.add(cell)
+                self.apples.discard(cell)
+            i += 3 * heads
+            for id in values[i:i + deaths]:
+                body = self.snakes.pop(id, None)  # Snakes that never made it on the board aren't known
+                if body is not None:
+                    self.occupied.difference_update(body)
+            i += deaths
+            for j in range(i, i + 3 * spawns, 3):
+                x, y = values[j + 1], values[j + 2]
+                body = deque([(x, y), (x - 1, y), (x - 2, y)])
+                self.snakes[values[j]] = body
+                self.occupied.update(body)
+            i += 3 * spawns
+            self.apples.update(zip(values[i:i + 2 * apples:2], values[i + 1:i + 2 * apples:2]))
+
+# Area of the window covered by the score text
+SCORE_RECT = pygame.Rect(Window_Width - 120, 10, 120, 24)
+
+# Screen cells (x, y) under SCORE_RECT
+SCORE_CELLS = [(x, y) for y in range(SCORE_RECT.top // Cell_Size, (SCORE_RECT.bottom - 1) // Cell_Size + 1)
+               for x in range(SCORE_RECT.left // Cell_Size, (SCORE_RECT.right - 1) // Cell_Size + 1)]
+
+# Area of the window covered by the replay status text
+STATUS_RECT = pygame.Rect(10, Window_Height - 30, 360, 24)
+
+# Moves skipped by seeking backwards or forwards in a replay
+SEEK_MOVES = 100
+
+# Initialize pygame and create the main display window
+def openWindow(caption):
+    global SnakespeedCLOCK, DISPLAYSURF, BASICFONT, BACKGROUND
 
-    # Initialize pygame and create the main display window
     pygame.init()
     SnakespeedCLOCK = pygame.time.Clock()
     DISPLAYSURF = pygame.display.set_mode((Window_Width, Window_Height))
     BASICFONT = pygame.font.Font('freesansbold.ttf', 18)
-    pygame.display.set_caption('Snake')  # Set window title
+    pygame.display.set_caption(caption)  # Set window title
+    BACKGROUND = makeBackground()  # Background and grid, drawn only once
+
+# Main function to start the game
+def main():
+    openWindow('Snake')
 
     # Show the start screen
     showStartScreen()
 
     # Main game loop that runs until the player quits
     while True:
-        runGame()
+        if WORLD_SIZE:
+            runWorldGame()
+        else:
+            runGame()
         showGameOverScreen()
 
 # Function that runs the game logic
 def runGame():
-    # Set a random start point for the snake
-    startx = random.randint(5, Cell_W - 6)
-    starty = random.randint(5, Cell_H - 6)
-    wormCoords = [{'x': startx, 'y': starty},
-                  {'x': startx - 1, 'y': starty},
-                  {'x': startx - 2, 'y': starty}]  # Snake starts with 3 segments
-    direction = RIGHT  # Snake initially moves to the right
-
-    # Start the apple in a random position
-    apple = getRandomLocation()
-
-    # Initialize score and speed
-    score = 0  # Track the player's score
-    Snakespeed = 5  # Initial speed of the snake
-
-    # Main game loop
+    # Set a random start point for the snake, heading right
+    seed = random.getrandbits(64)
+    env = SnakeEnv(seed)
+    worm = env.worm
+    moves = bytearray()  # Direction of every move, saved as a replay when the game ends
+    turns = deque()  # Direction changes waiting for the next moves
+    autopilot = Autopilot() if AUTOPILOT else None  # Press A to switch it on or off
+
+    # Initialize speed
+    Snakespeed = 5  # Initial speed of the snake (moves per second)
+
+    # Draw the whole first frame, the loop below only repaints what changes
+    DISPLAYSURF.blit(BACKGROUND, (0, 0))
+    drawWorm(worm.body)  # Draw the snake
+    drawApple(env.apple)  # Draw the apple
+    drawScore(len(worm.body) - 3, boardPainter(env))  # Display the score
+    pygame.display.update()
+
+    # The snake moves on its own fixed timestep, independent of the frame rate
+    SnakespeedCLOCK.tick()
+    moveDue = 0.0  # Milliseconds since the last move
+
+    # Main game loop, one pass per frame
     while True:
         # Event handling loop (keyboard and quitting)
         for event in pygame.event.get():
             if event.type == QUIT:
                 terminate()  # Quit the game
             elif event.type == KEYDOWN:
-                # Change direction based on key press, but avoid 180-degree turns
-                if (event.key == K_LEFT) and direction != RIGHT:
-                    direction = LEFT
-                elif (event.key == K_RIGHT) and direction != LEFT:
-                    direction = RIGHT
-                elif (event.key == K_UP) and direction != DOWN:
-                    direction = UP
-                elif (event.key == K_DOWN) and direction != UP:
-                    direction = DOWN
-                elif event.key == K_ESCAPE:
+                if event.key == K_ESCAPE:
                     terminate()  # Quit if ESC is pressed
+                if event.key == K_a:
+                    autopilot = None if autopilot else Autopilot()
+                    turns.clear()
+                queueTurn(turns, KEY_DIRECTIONS.get(event.key), env.direction)
 
-        # Check if the snake has hit the edge of the window or itself
-        if wormCoords[HEAD]['x'] == -1 or wormCoords[HEAD]['x'] == Cell_W or wormCoords[HEAD]['y'] == -1 or \
-                wormCoords[HEAD]['y'] == Cell_H:
-            return  # Game over when hitting the boundary
-        for wormBody in wormCoords[1:]:
-            if wormBody['x'] == wormCoords[HEAD]['x'] and wormBody['y'] == wormCoords[HEAD]['y']:
-                return  # Game over if snake collides with itself
-
-        # Check if the snake has eaten the apple
-        if wormCoords[HEAD]['x'] == apple['x'] and wormCoords[HEAD]['y'] == apple['y']:
-            # Don't remove the tail when the snake eats the apple
-            apple = getRandomLocation()  # Generate a new apple location
-            score += 1  # Increment score
-            # Increase speed every 10 points
-            if score % 10 == 0:
-                Snakespeed += 1  # Increase the snake's speed level
-        else:
-            del wormCoords[-1]  # Remove the tail if no apple is eaten
-
-        # Move the snake in the current direction
-        if direction == UP:
-            newHead = {'x': wormCoords[HEAD]['x'], 'y': wormCoords[HEAD]['y'] - 1}
-        elif direction == DOWN:
-            newHead = {'x': wormCoords[HEAD]['x'], 'y': wormCoords[HEAD]['y'] + 1}
-        elif direction == LEFT:
-            newHead = {'x': wormCoords[HEAD]['x'] - 1, 'y': wormCoords[HEAD]['y']}
-        elif direction == RIGHT:
-            newHead = {'x': wormCoords[HEAD]['x'] + 1, 'y': wormCoords[HEAD]['y']}
-
-        wormCoords.insert(0, newHead)  # Insert the new head at the front of the snake
-
-        # Redraw everything on the screen
-        DISPLAYSURF.fill(BGCOLOR)
-        drawGrid()  # Draw the grid
-        drawWorm(wormCoords)  # Draw the snake
-        drawApple(apple)  # Draw the apple
-        drawScore(len(wormCoords) - 3)  # Display the score
-        pygame.display.update()
-        SnakespeedCLOCK.tick(Snakespeed)  # Control the game's frame rate
+        moveDue += SnakespeedCLOCK.tick(FPS)  # Control the frame rate
+        period = 1000.0 / Snakespeed
+        moveDue = min(moveDue, 3 * period)  # Don't rush through many moves after a stall
+
+        dirty = []
+        scored = False
+        while moveDue >= period:
+            moveDue -= period
+
+            # Move the snake; the game is over when it hits the edge or itself
+            if autopilot is not None:
+                reward, done = env.step(autopilot.choose(env))
+            else:
+                reward, done = env.step(turns.popleft() if turns else None)
+            moves.append(DIRECTION_CODES[env.direction])
+            if done:
+                saveReplay(seed, moves)
+                return
+            if reward > 0 and env.score % 10 == 0:
+                Snakespeed += 1  # Increase the snake's speed level every 10 points
+                period = 1000.0 / Snakespeed
+
+            # Repaint only what changed: the vacated tail, the new head, the apple and the score
+            if worm.vacated is not None:
+                dirty.append(eraseCell(worm.vacated))
+            dirty.append(drawSegment(worm.head()))
+            if reward > 0:
+                dirty.append(drawApple(env.apple))
+                scored = True
+        if dirty:
+            if scored or SCORE_RECT.collidelist(dirty) != -1:  # Changed, or cells under it were repainted
+                dirty.append(drawScore(len(worm.body) - 3, boardPainter(env)))
+            pygame.display.update(dirty)
+
+# Queue a turn to newDirection (None for a key that isn't an arrow) unless it
+# repeats or reverses the last planned direction. Used for the player's keys
+# and for the arena's snakes
+def queueTurn(turns, newDirection, direction):
+    planned = turns[-1] if turns else direction
+    if newDirection is not None and newDirection != planned and \
+            newDirection != OPPOSITE[planned] and len(turns) < MAX_TURNS:
+        turns.append(newDirection)
+
+# Runs a game on a WORLD_SIZE board, seen through a camera that follows the head.
+# Like runGame it only repaints what changed, except when the camera scrolls and
+# the chunks under it are redrawn
+def runWorldGame():
+    width, height = WORLD_SIZE
+    apples = WORLD_APPLES if WORLD_APPLES is not None else width * height // 400
+    env = WorldEnv(width, height, apples)
+    turns = deque()  # Direction changes waiting for the next moves
+    Snakespeed = 5  # Initial speed of the snake (moves per second)
+
+    camera = followCamera(None, env.body[HEAD], width, height)
+    drawWorld(env, camera)
+    pygame.display.update()
+    SnakespeedCLOCK.tick()
+    moveDue = 0.0  # Milliseconds since the last move
+
+    while True:
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                terminate()
+            elif event.type == KEYDOWN:
+                if event.key == K_ESCAPE:
+                    terminate()
+                queueTurn(turns, KEY_DIRECTIONS.get(event.key), env.direction)
+
+        moveDue += SnakespeedCLOCK.tick(FPS)
+        period = 1000.0 / Snakespeed
+        moveDue = min(moveDue, 3 * period)  # Don't rush through many moves after a stall
+
+        dirty = []
+        scrolled = scored = False
+        while moveDue >= period:
+            moveDue -= period
+            reward, done = env.step(turns.popleft() if turns else None)
+            if done:
+                return
+            if reward > 0 and env.score % 10 == 0:
+                Snakespeed += 1
+                period = 1000.0 / Snakespeed
+
+            newCamera = followCamera(camera, env.body[HEAD], width, height)
+            if newCamera != camera:
+                camera = newCamera
+                scrolled = True
+            if scrolled:
+                continue  # The whole window is redrawn below
+            if env.vacated is not None and inView(env.vacated, camera):
+                dirty.append(eraseRect(worldRect(env.vacated, camera)))
+            dirty.append(paintSegment(worldRect(env.body[HEAD], camera)))
+            for apple in env.spawned:
+                if inView(apple, camera):
+                    dirty.append(paintApple(worldRect(apple, camera)))
+            scored = scored or reward > 0
+        if scrolled:
+            drawWorld(env, camera)
+            pygame.display.update()
+        elif dirty:
+            if scored or SCORE_RECT.collidelist(dirty) != -1:
+                dirty.append(drawScore(env.score, worldPainter(env, camera)))
+            pygame.display.update(dirty)
+
+# Top left cell of the camera after the head moved to cell: it scrolls just
+# enough to keep the head CAMERA_MARGIN cells inside the window, without
+# showing anything beyond the board. camera is None to center it on the head
+def followCamera(camera, cell, width, height):
+    x, y = cell
+    if camera is None:
+        left, top = x - Cell_W // 2, y - Cell_H // 2
+    else:
+        left, top = camera
+        left = min(max(left, x - Cell_W + 1 + CAMERA_MARGIN), x - CAMERA_MARGIN)
+        top = min(max(top, y - Cell_H + 1 + CAMERA_MARGIN), y - CAMERA_MARGIN)
+    return min(max(left, 0), width - Cell_W), min(max(top, 0), height - Cell_H)
+
+# Whether a world cell is under the camera
+def inView(cell, camera):
+    return 0 <= cell[0] - camera[0] < Cell_W and 0 <= cell[1] - camera[1] < Cell_H
+
+# Screen rectangle of a world cell
+def worldRect(cell, camera):
+    return pygame.Rect((cell[0] - camera[0]) * Cell_Size, (cell[1] - camera[1]) * Cell_Size,
+                       Cell_Size, Cell_Size)
+
+# Repaint the window with the part of the world under the camera
+def drawWorld(env, camera):
+    DISPLAYSURF.blit(BACKGROUND, (0, 0))
+    for chunk in env.world.chunksIn(camera[0], camera[1], Cell_W, Cell_H):
+        for cell in chunk.snake:
+            if inView(cell, camera):
+                paintSegment(worldRect(cell, camera))
+        for cell in chunk.apples:
+            if inView(cell, camera):
+                paintApple(worldRect(cell, camera))
+    drawScore(env.score, worldPainter(env, camera))
+
+# Save a finished game in REPLAY_DIR, named after the time it ended
+def saveReplay(seed, moves):
+    if REPLAY_DIR is None:
+        return
+    os.makedirs(REPLAY_DIR, exist_ok=True)
+    name = time.strftime('snake-%Y%m%d-%H%M%S-') + '%016x.replay' % seed
+    Replay.save(os.path.join(REPLAY_DIR, name), seed, moves)
+
+# Play a recorded game back at speed times the pace it was played at.
+# Space pauses, the left and right arrows seek by SEEK_MOVES, Home and End
+# jump to the start and the end, and 1-9 fast-forward by 1x, 2x, 4x ... 256x
+def playReplay(path, speed=1):
+    replay = Replay.load(path)
+    openWindow('Snake replay')
+
+    tick = 0
+    env = replay.frame(tick)
+    paused = False
+    drawReplayFrame(env, tick, len(replay.moves), speed, paused)
+    SnakespeedCLOCK.tick()
+    moveDue = 0.0  # Milliseconds since the last move
+
+    while True:
+        seekTo = None
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                terminate()
+            elif event.type == KEYDOWN:
+                if event.key == K_ESCAPE:
+                    terminate()
+                elif event.key == K_SPACE:
+                    paused = not paused
+                    seekTo = tick  # Repaint the status
+                elif event.key in (K_LEFT, K_RIGHT, K_HOME, K_END):
+                    seekTo = {K_LEFT: tick - SEEK_MOVES, K_RIGHT: tick + SEEK_MOVES,
+                              K_HOME: 0, K_END: len(replay.moves)}[event.key]
+                    seekTo = min(max(seekTo, 0), len(replay.moves))
+                elif K_1 <= event.key <= K_9:
+                    speed = 1 << (event.key - K_1)
+                    seekTo = tick
+
+        moveDue += SnakespeedCLOCK.tick(FPS)
+        if seekTo is not None:
+            tick = seekTo
+            env = replay.frame(tick)
+            drawReplayFrame(env, tick, len(replay.moves), speed, paused)
+            moveDue = 0.0
+        if paused or tick == len(replay.moves):
+            moveDue = 0.0
+        moveDue = min(moveDue, 250.0)  # Don't rush through many moves after a stall
+
+        # Replay the moves that are due, at the speed runGame played them at
+        dirty = []
+        scored = False
+        while tick < len(replay.moves):
+            period = 1000.0 / ((5 + env.score // 10) * speed)
+            if moveDue < period:
+                break
+            moveDue -= period
+            reward, done = env.step(DIRECTIONS[replay.moves[tick]])
+            tick += 1
+            if done:
+                break
+            if env.worm.vacated is not None:
+                dirty.append(eraseCell(env.worm.vacated))
+            dirty.append(drawSegment(env.worm.head()))
+            if reward > 0:
+                dirty.append(drawApple(env.apple))
+                scored = True
+        if dirty:
+            if scored or SCORE_RECT.collidelist(dirty) != -1:
+                dirty.append(drawScore(env.score, boardPainter(env)))
+            dirty.append(drawReplayStatus(tick, len(replay.moves), speed, paused))
+            pygame.display.update(dirty)
+
+# Repaint the whole window for a replay frame
+def drawReplayFrame(env, tick, total, speed, paused):
+    DISPLAYSURF.blit(BACKGROUND, (0, 0))
+    drawWorm(env.worm.body)
+    if env.apple is not None:
+        drawApple(env.apple)
+    drawScore(env.score, boardPainter(env))
+    drawReplayStatus(tick, total, speed, paused)
+    pygame.display.update()
+
+# Draw the replay position and speed in the bottom left and return the area to update
+def drawReplayStatus(tick, total, speed, paused):
+    text = 'Move %d / %d   %dx%s' % (tick, total, speed, '   paused' if paused else '')
+    statusSurf = BASICFONT.render(text, True, White)
+    DISPLAYSURF.blit(BACKGROUND, STATUS_RECT, STATUS_RECT)
+    DISPLAYSURF.blit(statusSurf, STATUS_RECT.topleft)
+    return STATUS_RECT
 
 # Display a message asking the player to press a key
 def drawPressKeyMsg():
@@ -167,48 +1231,56 @@ def drawPressKeyMsg():
     pressKeyRect.topleft = (Window_Width - 200, Window_Height - 30)
     DISPLAYSURF.blit(pressKeySurf, pressKeyRect)
 
-# Check if any key has been pressed
-def checkForKeyPress():
-    if len(pygame.event.get(QUIT)) > 0:
+# Block until a key is released or timeout milliseconds pass (0 waits forever).
+# Returns the released key, or None if nothing was pressed
+def waitForKeyPress(timeout=0):
+    event = pygame.event.wait(timeout)
+    if event.type == QUIT:
         terminate()  # Quit the game if the player closes the window
-    keyUpEvents = pygame.event.get(KEYUP)
-    if len(keyUpEvents) == 0:
-        return None
-    if keyUpEvents[0].key == K_ESCAPE:
-        terminate()  # Quit if the player presses ESC
-    return keyUpEvents[0].key
+    if event.type == KEYUP:
+        if event.key == K_ESCAPE:
+            terminate()  # Quit if the player presses ESC
+        return event.key
+    return None
+
+# Rotated title frames of the start screen, rendered once
+TITLE_FRAMES = []
 
 # Display the start screen before the game begins
 def showStartScreen():
-    titleFont = pygame.font.Font('freesansbold.ttf', 100)
-    titleSurf1 = titleFont.render('Snake!', True, White, DARKGreen)
-    degrees1 = 0
+    if not TITLE_FRAMES:
+        titleFont = pygame.font.Font('freesansbold.ttf', 100)
+        titleSurf1 = titleFont.render('Snake!', True, White, DARKGreen)
+        for degrees in range(0, 360, 3):  # Rotate by 3 degrees each frame for animation
+            TITLE_FRAMES.append(pygame.transform.rotate(titleSurf1, degrees))
 
+    frame = 0
+    lastRect = DISPLAYSURF.get_rect()  # The first frame repaints the whole window
+    nextFrame = pygame.time.get_ticks()
     while True:
-        DISPLAYSURF.fill(BGCOLOR)
-        rotatedSurf1 = pygame.transform.rotate(titleSurf1, degrees1)  # Rotate the title for animation
-        rotatedRect1 = rotatedSurf1.get_rect()
-        rotatedRect1.center = (Window_Width / 2, Window_Height / 2)
-        DISPLAYSURF.blit(rotatedSurf1, rotatedRect1)
-
-        drawPressKeyMsg()  # Draw message prompting the user to press a key
+        # Draw the next frame once its time has come
+        if pygame.time.get_ticks() >= nextFrame:
+            DISPLAYSURF.fill(BGCOLOR, lastRect)
+            rotatedSurf1 = TITLE_FRAMES[frame % len(TITLE_FRAMES)]
+            rotatedRect1 = rotatedSurf1.get_rect()
+            rotatedRect1.center = (Window_Width / 2, Window_Height / 2)
+            DISPLAYSURF.blit(rotatedSurf1, rotatedRect1)
+            drawPressKeyMsg()  # Draw message prompting the user to press a key
+            pygame.display.update([lastRect, rotatedRect1])
+            lastRect = rotatedRect1
+            frame += 1
+            nextFrame += 1000 // Snakespeed
 
-        if checkForKeyPress():  # Wait for a keypress to start the game
-            pygame.event.get()  # Clear event queue
+        # Sleep in the event queue until a key is pressed or the next frame is due
+        if waitForKeyPress(max(1, nextFrame - pygame.time.get_ticks())):
+            pygame.event.clear()  # Clear event queue
             return
-        pygame.display.update()
-        SnakespeedCLOCK.tick(Snakespeed)
-        degrees1 += 3  # Rotate by 3 degrees each frame for animation
 
 # Quit the game
 def terminate():
     pygame.quit()
     sys.exit()
 
-# Generate a random location for the apple
-def getRandomLocation():
-    return {'x': random.randint(0, Cell_W - 1), 'y': random.randint(0, Cell_H - 1)}
-
 # Display the game over screen
 def showGameOverScreen():
     gameOverFont = pygame.font.Font('freesansbold.ttf', 100)
@@ -224,47 +1296,276 @@ def showGameOverScreen():
     drawPressKeyMsg()  # Prompt player to press a key to restart
     pygame.display.update()
     pygame.time.wait(500)  # Wait for a short duration
-    checkForKeyPress()  # Clear out any keypresses in the event queue
+    pygame.event.clear()  # Clear out any keypresses in the event queue
 
-    while True:
-        if checkForKeyPress():  # Wait for a keypress to restart the game
-            pygame.event.get()  # Clear event queue
-            return
+    # Sleep in the event queue until a key is pressed to restart the game
+    while not waitForKeyPress(1000):
+        pass
+    pygame.event.clear()  # Clear event queue
 
-# Draw the player's score in the top right of the screen
-def drawScore(score):
+# Draw the player's score in the top right of the screen and return the area to update.
+# The score sits over board cells, so after clearing it repaintCell(x, y) puts
+# back whatever is on each screen cell under it, and the text goes on top last
+def drawScore(score, repaintCell):
     scoreSurf = BASICFONT.render('Score: %s' % (score), True, White)
     scoreRect = scoreSurf.get_rect()
-    scoreRect.topleft = (Window_Width - 120, 10)
+    scoreRect.topleft = SCORE_RECT.topleft
+    DISPLAYSURF.blit(BACKGROUND, SCORE_RECT, SCORE_RECT)  # Clear the previous score
+    for x, y in SCORE_CELLS:
+        repaintCell(x, y)
     DISPLAYSURF.blit(scoreSurf, scoreRect)
+    return SCORE_RECT
+
+# Repaints the snake segment or the apple on a screen cell of a SnakeEnv board
+def boardPainter(env):
+    def repaintCell(x, y):
+        cell = packCell(x, y)
+        if env.worm.occupied[cell]:
+            drawSegment(cell)
+        elif cell == env.apple:
+            drawApple(cell)
+    return repaintCell
+
+# Repaints the snake segment or the apple on a screen cell of a WorldEnv seen through camera
+def worldPainter(env, camera):
+    def repaintCell(x, y):
+        cell = (camera[0] + x, camera[1] + y)
+        chunk = env.world.lookup(*cell)
+        if cell in chunk.snake:
+            paintSegment(worldRect(cell, camera))
+        elif cell in chunk.apples:
+            paintApple(worldRect(cell, camera))
+    return repaintCell
+
+# Screen rectangle of a cell
+def cellRect(cell):
+    x, y = cellXY(cell)
+    return pygame.Rect(x * Cell_Size, y * Cell_Size, Cell_Size, Cell_Size)
+
+# Restore the background of a cell and return its rect
+def eraseCell(cell):
+    return eraseRect(cellRect(cell))
+
+# Restore the background under a screen rect and return it
+def eraseRect(rect):
+    DISPLAYSURF.blit(BACKGROUND, rect, rect)
+    return rect
+
+# Draw one segment of the snake and return its rect
+def drawSegment(cell):
+    return paintSegment(cellRect(cell))
+
+# Draw a snake segment filling a screen rect and return it
+def paintSegment(wormSegmentRect):
+    pygame.draw.rect(DISPLAYSURF, DARKGreen, wormSegmentRect)  # Draw the outer square for the worm's body
+    wormInnerSegmentRect = wormSegmentRect.inflate(-8, -8)  # Draw the inner square
+    pygame.draw.rect(DISPLAYSURF, Green, wormInnerSegmentRect)
+    return wormSegmentRect
 
 # Draw the snake on the screen
-def drawWorm(wormCoords):
-    for coord in wormCoords:
-        x = coord['x'] * Cell_Size
-        y = coord['y'] * Cell_Size
-        wormSegmentRect = pygame.Rect(x, y, Cell_Size, Cell_Size)  # Draw the outer square for the worm's body
-        pygame.draw.rect(DISPLAYSURF, DARKGreen, wormSegmentRect)
-        wormInnerSegmentRect = pygame.Rect(x + 4, y + 4, Cell_Size - 8, Cell_Size - 8)  # Draw the inner square
-        pygame.draw.rect(DISPLAYSURF, Green, wormInnerSegmentRect)
-
-# Draw the apple on the screen
-def drawApple(coord):
-    x = coord['x'] * Cell_Size
-    y = coord['y'] * Cell_Size
-    appleRect = pygame.Rect(x, y, Cell_Size, Cell_Size)
+def drawWorm(wormBody):
+    for cell in wormBody:
+        drawSegment(cell)
+
+# Draw the apple on the screen and return its rect
+def drawApple(cell):
+    return paintApple(cellRect(cell))
+
+# Draw an apple filling a screen rect and return it
+def paintApple(appleRect):
     pygame.draw.rect(DISPLAYSURF, Red, appleRect)
+    return appleRect
 
-# Draw the grid on the screen for visual effect
-def drawGrid():
+# Pre-render the background color and the grid once, frames copy parts of it
+def makeBackground():
+    background = pygame.Surface((Window_Width, Window_Height)).convert()
+    background.fill(BGCOLOR)
+    drawGrid(background)
+    return background
+
+# Draw the grid on a surface for visual effect
+def drawGrid(surface):
     for x in range(0, Window_Width, Cell_Size):  # Draw vertical lines
-        pygame.draw.line(DISPLAYSURF, DARKGRAY, (x, 0), (x, Window_Height))
+        pygame.draw.line(surface, DARKGRAY, (x, 0), (x, Window_Height))
     for y in range(0, Window_Height, Cell_Size):  # Draw horizontal lines
-        pygame.draw.line(DISPLAYSURF, DARKGRAY, (0, y), (Window_Width, y))
+        pygame.draw.line(surface, DARKGRAY, (0, y), (Window_Width, y))
+
+# Play games with the autopilot and no window, printing the result and speed of each
+def runHeadless(games, seed=None, maxTicks=1000000):
+    for game in range(games):
+        env = SnakeEnv(None if seed is None else seed + game)
+        autopilot = Autopilot()
+        ticks = 0
+        start = time.perf_counter()
+        while not env.done and ticks < maxTicks:
+            env.step(autopilot.choose(env))
+            ticks += 1
+        spent = time.perf_counter() - start
+        print('game %d: score %d, %d ticks, %.0f ticks/s' % (game, env.score, ticks, ticks / spent))
+
+# Split an arena address into ('unix', path) for unix:PATH, or (host, port) for HOST:PORT
+def parseAddress(address):
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+# Serves an Arena to clients over asyncio streams. Each client controls a snake
+# and gets every tick's diff; a tick's diff is encoded once and the same bytes
+# are queued to every client without waiting on any of them, so slow clients
+# can't hold the tick back (they are dropped once ARENA_MAX_BUFFER is queued)
+class ArenaServer:
+    def __init__(self, arena, tickRate=ARENA_TICK_RATE):
+        self.arena = arena
+        self.tickRate = tickRate
+        self.writers = {}  # Snake id -> the StreamWriter of its client
+
+    # Talk to one client until it disconnects
+    async def handleClient(self, reader, writer):
+        try:
+            snake = self.arena.join()
+        except ValueError:
+            writer.close()
+            return
+        writer.write(arenaMessage(ARENA_WELCOME, WELCOME.pack(snake.id, self.arena.world.width,
+                                                               self.arena.world.height, self.tickRate)))
+        writer.write(arenaMessage(ARENA_SNAPSHOT, self.arena.snapshot()))
+        self.writers[snake.id] = writer
+        try:
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    break
+                for code in data:
+                    if code < len(DIRECTIONS):
+                        self.arena.turn(snake, DIRECTIONS[code])
+        except OSError:
+            pass
+        finally:
+            del self.writers[snake.id]
+            self.arena.leave(snake)
+            writer.close()
+
+    # Step the arena on a fixed timestep forever, reporting the load every few seconds
+    async def run(self, address):
+        kind, where = parseAddress(address)
+        if kind == 'unix':
+            server = await asyncio.start_unix_server(self.handleClient, where, backlog=ARENA_BACKLOG)
+        else:
+            server = await asyncio.start_server(self.handleClient, kind, where, backlog=ARENA_BACKLOG)
+        print('Arena of %dx%d on %s' % (self.arena.world.width, self.arena.world.height, address))
+
+        loop = asyncio.get_running_loop()
+        period = 1.0 / self.tickRate
+        nextTick = loop.time()
+        busy = slowest = 0.0  # Seconds spent stepping and broadcasting since the last report
+        late = 0  # Ticks that started more than a whole tick late
+        async with server:
+            while True:
+                nextTick += period
+                delay = nextTick - loop.time()
+                if delay < -period:
+                    late += 1
+                    nextTick = loop.time()  # Don't try to catch up on missed ticks
+                await asyncio.sleep(max(delay, 0))  # Also lets the clients' turns in when running late
+
+                start = time.perf_counter()
+                frame = arenaMessage(ARENA_DIFF, self.arena.step())
+                for writer in list(self.writers.values()):
+                    if writer.transport.get_write_buffer_size() > ARENA_MAX_BUFFER:
+                        writer.close()  # Too slow to keep up; its handler cleans up
+                    else:
+                        writer.write(frame)
+                spent = time.perf_counter() - start
+                busy += spent
+                slowest = max(slowest, spent)
+
+                if self.arena.tick % (5 * self.tickRate) == 0:
+                    print('tick %d: %d snakes, %.2f ms per tick (max %.2f), %d late ticks' % (
+                        self.arena.tick, len(self.arena.snakes), busy * 1000 / (5 * self.tickRate),
+                        slowest * 1000, late))
+                    busy = slowest = 0.0
+                    late = 0
+
+# Read one message from the server, returning (kind, payload), or None once it disconnects
+async def readMessage(reader):
+    try:
+        kind, length = MESSAGE.unpack(await reader.readexactly(MESSAGE.size))
+        return kind, await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, OSError):
+        return None
+
+# A simple client for load tests: keeps an ArenaMirror and now and then turns
+# to a random direction that doesn't run straight into the edge or a snake
+async def arenaBot(address, rng):
+    kind, where = parseAddress(address)
+    if kind == 'unix':
+        reader, writer = await asyncio.open_unix_connection(where)
+    else:
+        reader, writer = await asyncio.open_connection(kind, where)
+    mirror = ArenaMirror()
+    while True:
+        message = await readMessage(reader)
+        if message is None:
+            break
+        mirror.apply(*message)
+        body = mirror.snakes.get(mirror.id)
+        if message[0] != ARENA_DIFF or body is None or len(body) < 2:
+            continue
+
+        # Head on unless a random turn comes up or the cell ahead is taken
+        (x, y), (nx, ny) = body[0], body[1]
+        safe = [direction for direction, (dx, dy) in MOVES.items()
+                if 0 <= x + dx < mirror.width and 0 <= y + dy < mirror.height and
+                (x + dx, y + dy) not in mirror.occupied]
+        ahead = [direction for direction in safe if MOVES[direction] == (x - nx, y - ny)]
+        if safe and (not ahead or rng.random() < 0.1):
+            writer.write(bytes([DIRECTION_CODES[rng.choice(safe)]]))
+    writer.close()
+
+# Connect count bots to the arena at address and run them until it shuts down
+async def runBots(address, count, seed=None):
+    rng = random.Random(seed)
+    await asyncio.gather(*(arenaBot(address, random.Random(rng.random())) for _ in range(count)))
 
 # Main execution
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Snake')
+    parser.add_argument('--autopilot', action='store_true', help='let the autopilot steer from the start')
+    parser.add_argument('--headless', type=int, metavar='GAMES', help='play GAMES autopilot games without a window')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the (first) headless game')
+    parser.add_argument('--replay', metavar='FILE', help='play back a recorded game')
+    parser.add_argument('--speed', type=int, default=1, help='fast-forward factor of the replay')
+    parser.add_argument('--replay-dir', default=REPLAY_DIR, help='directory to record games in')
+    parser.add_argument('--world', metavar='WxH', help='play on a big WxH board that scrolls, e.g. 2000x2000')
+    parser.add_argument('--apples', type=int, default=None, help='apples on the big board at once')
+    parser.add_argument('--arena', metavar='ADDRESS', help='serve a multi-snake arena on HOST:PORT or unix:PATH')
+    parser.add_argument('--bots', type=int, metavar='N', help='connect N bots to the arena at --arena instead')
+    parser.add_argument('--tick-rate', type=int, default=ARENA_TICK_RATE, help='arena ticks per second')
+    args = parser.parse_args()
+    AUTOPILOT = args.autopilot
+    REPLAY_DIR = args.replay_dir
+    if args.world:
+        try:
+            WORLD_SIZE = tuple(int(size) for size in args.world.lower().split('x'))
+        except ValueError:
+            parser.error('--world must look like 2000x2000')
+        if len(WORLD_SIZE) != 2 or WORLD_SIZE[0] < Cell_W or WORLD_SIZE[1] < Cell_H:
+            parser.error('--world must be at least %dx%d' % (Cell_W, Cell_H))
+    WORLD_APPLES = args.apples
+
     try:
-        main()  # Start the game
-    except SystemExit:
+        if args.arena and args.bots:
+            asyncio.run(runBots(args.arena, args.bots, args.seed))
+        elif args.arena:
+            width, height = WORLD_SIZE or ARENA_SIZE
+            apples = WORLD_APPLES if WORLD_APPLES is not None else width * height // 400
+            asyncio.run(ArenaServer(Arena(width, height, apples, args.seed), args.tick_rate).run(args.arena))
+        elif args.replay:
+            playReplay(args.replay, args.speed)
+        elif args.headless:
+            runHeadless(args.headless, args.seed)
+        else:
+            main()  # Start the game
+    except (SystemExit, KeyboardInterrupt):
         pass  # Exit the program gracefully